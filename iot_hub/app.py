@@ -1,68 +1,115 @@
 """Main Flask app."""
-from datetime import datetime
+import os
+from time import perf_counter, time
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from connexion import App
 
-from flask import render_template
+from defaults import DEFAULT_STATE
 
-from houses import HOUSES
+from flask import Response, g, render_template
+
+from houses import HISTORY, STORE
+
+from leader import LeaderLock
+
+from metrics import (
+    CONTENT_TYPE,
+    LATENCY,
+    REQUESTS,
+    WATCHDOG_LOST,
+    WATCHDOG_SWEEP,
+    render as render_metrics,
+)
+
+from store import LIVE_STATUSES
+
+from validation import (
+    SERVER_TIMING,
+    VALIDATOR_MAP,
+    add_server_timing,
+    current_operation,
+    register_operations,
+)
+
+from wire import CborMiddleware
+
+# Seconds between watchdog runs, bounds how late a house is marked as Lost
+WATCHDOG_INTERVAL_S = float(os.environ.get("IOT_HUB_WATCHDOG_INTERVAL_S", 2))
 
 app = App(__name__, specification_dir="./")
-app.add_api("openapi.yaml")
+api = app.add_api("openapi.yaml", validator_map=VALIDATOR_MAP)
+register_operations(api.specification)
+if SERVER_TIMING:
+    app.app.after_request(add_server_timing)
+app.app.wsgi_app = CborMiddleware(app.app.wsgi_app)
 
 
 def watchdog():
-    """De-activate houses based on last keep-alive timestamp."""
-    for unique_id in HOUSES:
-        try:
-            last_seen_time = datetime.strptime(
-                HOUSES[unique_id]["timestamp_keepalive"], "%Y-%m-%d %H:%M:%S"
-            )
-        except ValueError:
-            last_seen_time = datetime.now()
-
-        last_seen_duration_seconds = (datetime.now() - last_seen_time).total_seconds()
-
-        if (
-            HOUSES[unique_id]["status"] != "Deleted"
-            and HOUSES[unique_id]["status"] != "Lost"
-            and last_seen_duration_seconds > 60
-        ):
-            HOUSES[unique_id].update(
-                {
-                    "status": "Lost",
-                    "state": {
-                        "alarm": {
-                            "triggered": False,
-                            "armed": False,
-                            "mode": 0,
-                            "armed_timestamp": 0,
-                            "triggered_timestamp": 0,
-                            "disarmed_timestamp": 0,
-                        },
-                        "buzzer": {
-                            "active": False,
-                            "timestamp": 0,
-                        },
-                        "fan": {
-                            "active": False,
-                            "clockwise": True,
-                            "timestamp": 0,
-                        },
-                        "led": {
-                            "active": False,
-                            "timestamp": 0,
-                        },
-                        "motion": {
-                            "motion_detected": False,
-                            "triggered_timestamp": 0,
-                            "released_timestamp": 0,
-                        },
-                    },
-                }
-            )
+    """De-activate houses whose keep-alive deadline has passed."""
+    started = perf_counter()
+    now = time()
+
+    for unique_id in STORE.expired(now):
+        with STORE.lock(unique_id):
+            house = STORE.get(unique_id)
+
+            # Keepalive could have moved the deadline after it was selected
+            if (
+                house is not None
+                and house["status"] in LIVE_STATUSES
+                and house.get("keepalive_deadline", 0) < now
+            ):
+                house.update(
+                    {
+                        "status": "Lost",
+                        "timestamp_lost_epoch": now,
+                        "state": DEFAULT_STATE,
+                    }
+                )
+                STORE.put(house)
+                HISTORY.record(house)
+                WATCHDOG_LOST.inc()
+
+    WATCHDOG_SWEEP.set_value(value=perf_counter() - started)
+
+
+@app.app.before_request
+def start_timer():
+    """Remember when request started for latency metrics."""
+    g.started = perf_counter()
+
+
+@app.app.after_request
+def count_request(response):
+    """Record latency and status code of API requests."""
+    operation = current_operation()
+
+    if operation is not None and "started" in g:
+        REQUESTS.inc(operation, str(response.status_code))
+        LATENCY.observe(operation, value=perf_counter() - g.started)
+
+    return response
+
+
+def start_watchdog(leader_lock_path=None):
+    """Run watchdog periodically in background thread.
+
+    With ``leader_lock_path`` several processes can call this, but only the
+    one holding the lock runs the watchdog, others keep trying to take over.
+    """
+    leader_lock = LeaderLock(leader_lock_path) if leader_lock_path else None
+
+    def job():
+        if leader_lock is None or leader_lock.acquire():
+            watchdog()
+
+    scheduler = BackgroundScheduler(daemon=True)
+    scheduler.add_job(func=job, trigger="interval", seconds=WATCHDOG_INTERVAL_S)
+    scheduler.start()
+
+    return scheduler
 
 
 @app.route("/")
@@ -71,25 +118,33 @@ def hello_world():
     return render_template("hello_world.html")
 
 
+@app.route("/metrics")
+def metrics():
+    """Serve metrics in Prometheus text exposition format."""
+    return Response(render_metrics(STORE), content_type=CONTENT_TYPE)
+
+
 @app.route("/ui")
 def ui_index():
     """Serve dashboard page."""
-    return render_template("ui_index.html", houses=HOUSES)
+    return render_template("ui_index.html", houses=STORE)
 
 
 @app.route("/static/list_houses")
 def list_houses():
     """Show list of houses."""
-    return render_template("list_houses.html", houses=HOUSES)
+    return render_template("list_houses.html", houses=STORE)
 
 
 if __name__ == "__main__":
-    scheduler = BackgroundScheduler(daemon=True)
-    scheduler.add_job(func=watchdog, trigger="interval", seconds=20)
-    scheduler.start()
+    scheduler = start_watchdog()
 
     app.run(
-        host="0.0.0.0", port=80, debug=True, use_reloader=False  # noqa: S201, S104
+        host="0.0.0.0",  # noqa: S104
+        port=int(os.environ.get("IOT_HUB_PORT", 80)),
+        debug=True,  # noqa: S201
+        use_reloader=False,
     )
 
     scheduler.shutdown()
+    STORE.close()
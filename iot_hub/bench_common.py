@@ -0,0 +1,33 @@
+"""Provides house records shared by benchmark scripts."""
+
+
+def make_house(number, state=None, **fields):
+    """Build house record the way ``houses.create`` stores it.
+
+    ``state`` replaces the small default state and ``fields`` override
+    top-level fields, so every benchmark gets the shape it measures.
+    """
+    unique_id = f"{number:012X}"
+    house = {
+        "unique_id": unique_id,
+        "ip_address": "192.168.1.42",
+        "status": "Active",
+        "timestamp_keepalive": "2023-07-13 00:01:02",
+        "timestamp_created": "2023-07-13 00:01:02",
+        "timestamp_modified": "",
+        "timestamp_deleted": "",
+        "update_from_ui": False,
+        "global_alarm": False,
+        "state": state,
+    }
+
+    if state is None:
+        house["state"] = {
+            "alarm": {"triggered": False, "armed": False, "mode": number % 3},
+            "led": {"active": False, "timestamp": 0},
+            "wall_msg": f"ID:{unique_id}",
+        }
+
+    house.update(fields)
+
+    return house
@@ -0,0 +1,109 @@
+"""Stress house stores with concurrent writers and snapshot readers.
+
+Writer threads toggle a counter of random houses with read-modify-write
+under the house lock and send keepalives, while reader threads keep listing
+the store. Every toggle must survive, so lost updates are reported.
+
+Run from the ``iot_hub`` folder, e.g. ``python bench_concurrency.py 10000 5``.
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from bench_common import make_house
+
+from store import MemoryStore, SqliteStore
+
+THREAD_COUNTS = (1, 2, 4, 8, 16)
+READERS = 2
+
+
+def writer(store, count, deadline, done):
+    """Toggle LED of random houses and send keepalives until deadline."""
+    toggles = 0
+
+    while time.perf_counter() < deadline:
+        unique_id = f"{random.randrange(count):012X}"
+
+        with store.lock(unique_id):
+            house = store.get(unique_id)
+            house["state"]["led"]["active"] = not house["state"]["led"]["active"]
+            house["toggles"] += 1
+            store.put(house)
+
+        store.touch(unique_id, {"timestamp_keepalive": time.time()})
+        toggles += 1
+
+    done.append(toggles)
+
+
+def reader(store, deadline, done, errors):
+    """List whole store and changes until deadline."""
+    reads = 0
+
+    while time.perf_counter() < deadline:
+        try:
+            store.values()
+            store.changed_since(store.version - 100)
+            store.query(limit=100, status="Active")
+        except Exception as e:  # noqa: B902
+            errors.append(e)
+        reads += 1
+
+    done.append(reads)
+
+
+def bench(name, store, count, duration, threads):
+    """Print write and read rates with given number of writer threads."""
+    toggles_before = sum(house["toggles"] for house in store.values())
+    deadline = time.perf_counter() + duration
+    writes, reads, errors = [], [], []
+    workers = [
+        threading.Thread(target=writer, args=(store, count, deadline, writes))
+        for _ in range(threads)
+    ] + [
+        threading.Thread(target=reader, args=(store, deadline, reads, errors))
+        for _ in range(READERS)
+    ]
+
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    toggles = sum(house["toggles"] for house in store.values()) - toggles_before
+
+    print(
+        f"{name:<8} writers={threads:>2} "
+        f"writes={sum(writes) / duration:>9,.0f}/s "
+        f"reads={sum(reads) / duration:>7,.0f}/s "
+        f"lost={sum(writes) - toggles} errors={len(errors)}"
+    )
+
+
+def main():
+    """Benchmark entry point."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    store = MemoryStore()
+    for number in range(count):
+        store.put(make_house(number, toggles=0))
+    for threads in THREAD_COUNTS:
+        bench("memory", store, count, duration, threads)
+    store.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = SqliteStore(os.path.join(folder, "houses.db"))
+        for number in range(count):
+            store.put(make_house(number, toggles=0))
+        for threads in THREAD_COUNTS:
+            bench("sqlite", store, count, duration, threads)
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
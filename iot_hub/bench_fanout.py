@@ -0,0 +1,65 @@
+"""Benchmark global alarm fan-out with full scan and with subscriber index.
+
+Run from the ``iot_hub`` folder, e.g. ``python bench_fanout.py 10000 100000``.
+"""
+import sys
+import time
+
+from bench_common import make_house
+
+from store import MemoryStore
+
+SUBSCRIBERS = 100
+REPEAT = 20
+
+
+def fanout_scan(store, unique_id):
+    """Find fan-out targets the way ``report_alarm`` did before the index."""
+    return [
+        house["unique_id"]
+        for house in store.values()
+        if house["unique_id"] != unique_id and house["state"]["alarm"]["mode"] == 2
+    ]
+
+
+def fanout_index(store, unique_id):
+    """Find fan-out targets with alarm subscriber index."""
+    return [
+        house for house in store.select(alarm_subscriber=True) if house != unique_id
+    ]
+
+
+def bench(count):
+    """Print per-alarm fan-out cost for both strategies."""
+    step = count // SUBSCRIBERS
+    store = MemoryStore()
+
+    for number in range(count):
+        mode = 2 if number % step == 0 else 0
+        store.put(make_house(number, {"alarm": {"mode": mode}}))
+
+    reporter = f"{0:012X}"
+    results = []
+
+    for strategy in (fanout_scan, fanout_index):
+        started = time.perf_counter()
+        for _ in range(REPEAT):
+            targets = strategy(store, reporter)
+        results.append((time.perf_counter() - started) / REPEAT)
+
+    print(
+        f"houses={count:>8} subscribers={len(targets) + 1} "
+        f"scan={results[0] * 1e3:9.3f}ms index={results[1] * 1e3:7.3f}ms"
+    )
+
+
+def main():
+    """Benchmark entry point."""
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
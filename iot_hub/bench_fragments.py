@@ -0,0 +1,78 @@
+"""Benchmark house listing with per-request encoding and cached JSON fragments.
+
+Run from the ``iot_hub`` folder, e.g. ``python bench_fragments.py 10000 100000``.
+"""
+import json
+import sys
+import time
+
+from bench_common import make_house
+
+from store import MemoryStore
+
+REPEAT = 10
+
+# Share of houses written between two listings in the warm-after-writes case
+WRITE_SHARE = 0.01
+
+
+def list_encoded(store):
+    """Encode whole listing the way ``read_all`` did before fragments."""
+    return json.dumps(store.values()).encode("utf-8")
+
+
+def list_fragments(store):
+    """Join cached fragments the way ``read_all`` does now."""
+    return b"[" + b",".join(store.house_json(house) for house in store.values()) + b"]"
+
+
+def timed(func, store, before=None):
+    """Get average duration of listing, running ``before`` ahead of each."""
+    total = 0
+
+    for _ in range(REPEAT):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        func(store)
+        total += time.perf_counter() - started
+
+    return total / REPEAT
+
+
+def bench(count):
+    """Print listing cost of encoding, cold, warm and partly written cache."""
+    store = MemoryStore()
+    for number in range(count):
+        store.put(make_house(number))
+
+    def touch_some():
+        for number in range(0, count, int(1 / WRITE_SHARE)):
+            store.touch(f"{number:012X}", {"timestamp_keepalive": time.time()})
+
+    def drop_cache():
+        store._house_fragments.clear()
+        store._state_fragments.clear()
+
+    encoded = timed(list_encoded, store)
+    cold = timed(list_fragments, store, drop_cache)
+    warm = timed(list_fragments, store)
+    written = timed(list_fragments, store, touch_some)
+
+    print(
+        f"houses={count:>7} encode={encoded * 1e3:7.1f}ms "
+        f"cold={cold * 1e3:7.1f}ms warm={warm * 1e3:6.1f}ms "
+        f"warm+{WRITE_SHARE:.0%} writes={written * 1e3:6.1f}ms"
+    )
+
+
+def main():
+    """Benchmark entry point."""
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
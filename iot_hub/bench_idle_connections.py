@@ -0,0 +1,124 @@
+"""Benchmark hub holding many idle persistent device connections.
+
+Every simulated board opens one HTTP/1.1 connection, registers over it and
+keeps it open while idle, like the firmware between keepalives. After the
+idle time, all boards send keepalives over their connections again, which
+must all still be open and answered as fast as on fresh ones.
+
+Start the hub first, e.g. ``IOT_HUB_BIND=127.0.0.1:8080 gunicorn app:app``,
+then run from the ``iot_hub`` folder, e.g.
+``python bench_idle_connections.py http://127.0.0.1:8080 5000 30 100`` for
+5000 boards idle for 30 seconds, then sending 100 keepalives per second, raising
+the open files limit with ``ulimit -n`` for both beforehand.
+"""
+import asyncio
+import json
+import sys
+import time
+
+API_PATH = "/smarthouse/v1"
+OPENING = 200
+
+
+async def call(connection, method, path, body):
+    """Send request over open connection and get status code."""
+    reader, writer = connection
+    data = json.dumps(body).encode()
+    head = (
+        f"{method} {API_PATH}{path} HTTP/1.1\r\nHost: hub\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n"
+    )
+    writer.write(head.encode() + data)
+    await writer.drain()
+
+    status_code = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+
+    return status_code
+
+
+async def board(number, rate, host, port, opening, connected, idle_done, results):
+    """Register over own connection, idle, then send keepalive over it."""
+    unique_id = f"B0A4D{number:07X}"
+    house = {"unique_id": unique_id, "ip_address": "10.0.0.1"}
+
+    async with opening:
+        connection = await asyncio.open_connection(host, port)
+        await call(connection, "POST", "/houses", house)
+    connected.append(unique_id)
+
+    await idle_done.wait()
+    # Boards send keepalives at own times, not all at once
+    await asyncio.sleep(number / rate)
+
+    start = time.perf_counter()
+    try:
+        status_code = await call(
+            connection, "PUT", f"/houses/{unique_id}/keepalive", house
+        )
+    except (OSError, EOFError, ValueError, IndexError):
+        # Hub dropped idle connection, a board would have to reconnect
+        results.append((None, time.perf_counter() - start))
+    else:
+        results.append((status_code, time.perf_counter() - start))
+
+    connection[1].close()
+
+
+async def bench(url, count, idle_s, rate):
+    """Print how many idle connections survived and keepalive latency."""
+    host, _, port = url.split("://", 1)[-1].partition(":")
+    opening = asyncio.Semaphore(OPENING)
+    idle_done = asyncio.Event()
+    connected, results = [], []
+
+    start = time.perf_counter()
+    boards = [
+        asyncio.ensure_future(
+            board(
+                number,
+                rate,
+                host,
+                int(port or 80),
+                opening,
+                connected,
+                idle_done,
+                results,
+            )
+        )
+        for number in range(count)
+    ]
+    while len(connected) < count:
+        await asyncio.sleep(0.1)
+        if any(task.done() and task.exception() for task in boards):
+            break
+    print(f"connected={len(connected)} in {time.perf_counter() - start:.1f}s")
+
+    await asyncio.sleep(idle_s)
+    idle_done.set()
+    await asyncio.gather(*boards, return_exceptions=True)
+
+    latencies = sorted(latency * 1000 for _, latency in results)
+    dropped = sum(1 for status_code, _ in results if status_code is None)
+    answered = sum(1 for status_code, _ in results if status_code == 200)
+    print(
+        f"idle={idle_s:g}s dropped={dropped} answered={answered}/{count} "
+        f"keepalive p50={latencies[len(latencies) // 2]:.1f}ms "
+        f"p99={latencies[len(latencies) * 99 // 100]:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        bench(
+            sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8080",
+            int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+            float(sys.argv[3]) if len(sys.argv) > 3 else 10,
+            float(sys.argv[4]) if len(sys.argv) > 4 else 100,
+        )
+    )
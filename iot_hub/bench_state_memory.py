@@ -0,0 +1,68 @@
+"""Benchmark memory per idle house with own and with shared default states.
+
+Run from the ``iot_hub`` folder, e.g. ``python bench_state_memory.py 100000``.
+"""
+import sys
+import tracemalloc
+
+from bench_common import make_house
+
+from defaults import DEFAULT_STATE
+
+import store
+from store import MemoryStore, _copy_record
+
+
+def registered_house(number, wall_msg):
+    """Build house record as registered by a freshly booted board."""
+    state = _copy_record(DEFAULT_STATE)
+    if wall_msg:
+        state["wall_msg"] = f"ID:{number:012X}"
+
+    return make_house(
+        number,
+        state,
+        ip_address=f"10.0.{number >> 8 & 255}.{number & 255}",
+        status="Registered",
+    )
+
+
+def measure(count, wall_msg):
+    """Get bytes per house held by store after writes and one listing."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    houses = MemoryStore()
+    for number in range(count):
+        houses.put(registered_house(number, wall_msg))
+    for house in houses.values():
+        houses.house_json(house)
+
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    return used / count
+
+
+def bench(count):
+    """Print memory per house for own and shared default states."""
+    for wall_msg in (False, True):
+        shared = measure(count, wall_msg)
+
+        # Emulate storing own copies of states as before the shared template
+        share_defaults = store.share_defaults
+        store.share_defaults = _copy_record
+        try:
+            own = measure(count, wall_msg)
+        finally:
+            store.share_defaults = share_defaults
+
+        print(
+            f"houses={count:>7} wall_msg={wall_msg!s:<5} "
+            f"own={own:7.0f}B shared={shared:7.0f}B saved={1 - shared / own:6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    for count in map(int, sys.argv[1:] or ["10000"]):
+        bench(count)
@@ -0,0 +1,63 @@
+"""Benchmark read and keepalive write costs of house stores.
+
+Run from the ``iot_hub`` folder, e.g. ``python bench_store.py 100000``.
+"""
+import os
+import sys
+import tempfile
+import time
+
+from bench_common import make_house
+
+from store import MemoryStore, SqliteStore
+
+
+def percentile(samples, fraction):
+    """Get percentile of sorted samples."""
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def bench(name, store, count):
+    """Print read latency and keepalive throughput of filled store."""
+    for number in range(count):
+        store.put(make_house(number))
+
+    samples = []
+    for number in range(0, count, max(1, count // 10000)):
+        unique_id = f"{number:012X}"
+        started = time.perf_counter()
+        store.get(unique_id)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+
+    started = time.perf_counter()
+    for number in range(count):
+        store.touch(
+            f"{number:012X}", {"status": "Active", "timestamp_keepalive": "now"}
+        )
+    if isinstance(store, SqliteStore):
+        store.commit_pending()
+    keepalive_rate = count / (time.perf_counter() - started)
+
+    print(
+        f"{name:<8} houses={count} "
+        f"get p50={percentile(samples, 0.5) * 1e6:.1f}us "
+        f"p99={percentile(samples, 0.99) * 1e6:.1f}us "
+        f"keepalive={keepalive_rate:,.0f}/s"
+    )
+
+    store.close()
+
+
+def main():
+    """Benchmark entry point."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    bench("memory", MemoryStore(), count)
+
+    with tempfile.TemporaryDirectory() as folder:
+        bench("sqlite", SqliteStore(os.path.join(folder, "houses.db")), count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark request throughput of a running IoT hub.
+
+Start the hub with either ``python app.py`` or ``gunicorn app:app`` first, then
+run from the ``iot_hub`` folder, e.g.
+``python bench_throughput.py http://127.0.0.1:80 16 10``.
+"""
+import http.client
+import json
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+HOUSE = "1337CAFEC0DE"
+KEEPALIVE_BODY = json.dumps({"unique_id": HOUSE, "ip_address": "192.168.1.42"})
+
+
+def client(netloc, deadline, counts):
+    """Send keepalives over one persistent connection until deadline."""
+    connection = http.client.HTTPConnection(netloc, timeout=10)
+    sent = 0
+
+    while time.perf_counter() < deadline:
+        connection.request(
+            "PUT",
+            f"/smarthouse/v1/houses/{HOUSE}/keepalive",
+            body=KEEPALIVE_BODY,
+            headers={"Content-Type": "application/json"},
+        )
+        response = connection.getresponse()
+        response.read()
+        # Dev server closes connection after every response
+        if response.will_close:
+            connection.close()
+        sent += 1
+
+    connection.close()
+    counts.append(sent)
+
+
+def main():
+    """Benchmark entry point."""
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:80"
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    netloc = urlsplit(url).netloc
+    deadline = time.perf_counter() + duration
+    counts = []
+    threads = [
+        threading.Thread(target=client, args=(netloc, deadline, counts))
+        for _ in range(clients)
+    ]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(
+        f"{url} clients={clients} requests={sum(counts)} "
+        f"rate={sum(counts) / duration:,.0f}/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
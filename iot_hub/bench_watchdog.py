@@ -0,0 +1,74 @@
+"""Benchmark watchdog tick with full keepalive scan and with deadline buckets.
+
+Run from the ``iot_hub`` folder, e.g. ``python bench_watchdog.py 10000 100000``.
+"""
+import sys
+import time
+from datetime import datetime
+
+from store import MemoryStore
+
+EXPIRING = 100
+
+
+def tick_scan(store, now):
+    """Find expired houses the way watchdog did before deadline buckets."""
+    return [
+        house["unique_id"]
+        for house in store.values()
+        if (
+            datetime.fromtimestamp(now)
+            - datetime.strptime(house["timestamp_keepalive"], "%Y-%m-%d %H:%M:%S")
+        ).total_seconds()
+        > 60
+    ]
+
+
+def bench(count):
+    """Print cost of one watchdog tick for both strategies."""
+    now = time.time()
+    store = MemoryStore()
+
+    for number in range(count):
+        # A few houses went silent, the rest keep sending keepalives
+        last_seen = now - 120 if number < EXPIRING else now
+        store.put(
+            {
+                "unique_id": f"{number:012X}",
+                "status": "Active",
+                "timestamp_keepalive": datetime.fromtimestamp(last_seen).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+                "keepalive_deadline": last_seen + 60,
+            }
+        )
+
+    started = time.perf_counter()
+    scanned = tick_scan(store, now)
+    scan_duration = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expired = store.expired(now)
+    bucket_duration = time.perf_counter() - started
+
+    if sorted(scanned) != sorted(expired):
+        raise SystemExit(
+            f"Buckets found {len(expired)} expired houses, scan {len(scanned)}"
+        )
+
+    print(
+        f"houses={count:>8} expired={len(expired)} "
+        f"scan={scan_duration * 1e3:9.3f}ms buckets={bucket_duration * 1e3:7.3f}ms"
+    )
+
+
+def main():
+    """Benchmark entry point."""
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Provides default house state shared between house records.
+
+Most houses keep devices at their defaults, so stored states share one
+read-only template instead of holding their own copies of it. A state equal
+to the template is the template itself, any other state only has own dicts
+for devices that differ from their defaults.
+"""
+
+
+class FrozenDict(dict):
+    """Dict shared between records, refusing changes in place.
+
+    Still a dict for JSON encoders and readers, while copies of records
+    handed out for changes turn it into a plain one.
+    """
+
+    def _refuse(self, *args, **kwargs):
+        raise TypeError("Shared default state is read-only, change a copy")
+
+    __setitem__ = __delitem__ = __ior__ = _refuse
+    clear = pop = popitem = setdefault = update = _refuse
+
+
+def freeze(value):
+    """Turn nested dicts into frozen ones."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+
+    return value
+
+
+# State of a freshly booted board, as the watchdog resets lost houses to
+DEFAULT_STATE = freeze(
+    {
+        "alarm": {
+            "triggered": False,
+            "armed": False,
+            "mode": 0,
+            "armed_timestamp": 0,
+            "triggered_timestamp": 0,
+            "disarmed_timestamp": 0,
+        },
+        "buzzer": {
+            "active": False,
+            "timestamp": 0,
+        },
+        "fan": {
+            "active": False,
+            "clockwise": True,
+            "timestamp": 0,
+        },
+        "led": {
+            "active": False,
+            "timestamp": 0,
+        },
+        "motion": {
+            "motion_detected": False,
+            "triggered_timestamp": 0,
+            "released_timestamp": 0,
+        },
+    }
+)
+
+
+def same_json(value, other):
+    """Compare values as their JSON, with key order, True and 1 or 0 and 0.0 apart."""
+    if isinstance(value, dict) and isinstance(other, dict):
+        return list(value) == list(other) and all(
+            same_json(value[key], item) for key, item in other.items()
+        )
+
+    if isinstance(value, list) and isinstance(other, list):
+        return len(value) == len(other) and all(map(same_json, value, other))
+
+    return type(value) is type(other) and value == other
+
+
+def share_defaults(state):
+    """Get state sharing all parts equal to default state with the template."""
+    if not isinstance(state, dict):
+        return state
+
+    if same_json(state, DEFAULT_STATE):
+        return DEFAULT_STATE
+
+    return {
+        key: DEFAULT_STATE[key] if same_json(value, DEFAULT_STATE.get(key)) else value
+        for key, value in state.items()
+    }
@@ -0,0 +1,42 @@
+"""Gunicorn settings for running IoT hub with several worker processes.
+
+Run from the ``iot_hub`` folder with ``gunicorn app:app``. All workers share
+house records through SQLite store, and the watchdog runs only in the worker
+holding the leader lock.
+"""
+import multiprocessing
+import os
+
+# Workers must share the store, in-memory one would give each its own fleet
+os.environ.setdefault("IOT_HUB_STORE", "sqlite://houses.db")
+
+bind = os.environ.get("IOT_HUB_BIND", "0.0.0.0:80")  # noqa: S104
+workers = int(os.environ.get("IOT_HUB_WORKERS", multiprocessing.cpu_count() * 2))
+
+# Threaded workers, so long-poll keepalives do not hold a whole process. Every
+# long-poll still holds a thread for up to its wait, so threads of all workers
+# must cover houses long-polling at once on top of 32 per worker for the rest
+worker_class = "gthread"
+long_polls = int(os.environ.get("IOT_HUB_LONG_POLLS", 0))
+threads = int(os.environ.get("IOT_HUB_THREADS", 32 + -(-long_polls // workers)))
+
+# Idle devices keep their connection open between keepalives, gthread workers
+# park idle connections in a selector without holding a thread for them, but
+# not while a long-poll keepalive waits on them
+keepalive = 75
+worker_connections = int(os.environ.get("IOT_HUB_CONNECTIONS", 10000))
+
+leader_lock_path = os.environ.get("IOT_HUB_LEADER_LOCK", "watchdog.lock")
+
+
+def on_starting(server):
+    """Refuse to start workers without shared store."""
+    if not os.environ["IOT_HUB_STORE"].startswith("sqlite://"):
+        raise RuntimeError("IOT_HUB_STORE must be shared between workers")
+
+
+def post_worker_init(worker):
+    """Start watchdog scheduler competing for leadership in every worker."""
+    from app import start_watchdog
+
+    start_watchdog(leader_lock_path=leader_lock_path)
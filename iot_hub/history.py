@@ -0,0 +1,214 @@
+"""Provides bounded per-house history of state changes."""
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from math import floor
+from time import time
+
+# Changes kept in memory per house, older ones are dropped or spilled
+HISTORY_SIZE = int(os.environ.get("IOT_HUB_HISTORY_SIZE", 256))
+
+# Folder to append dropped changes to as JSON lines per house, empty to discard
+HISTORY_DIR = os.environ.get("IOT_HUB_HISTORY_DIR", "")
+
+# Changes between full state keyframes, so any point is rebuilt from a
+# keyframe and at most that many changes instead of the whole history
+KEYFRAME_INTERVAL = 32
+
+_MISSING = object()
+
+
+def flatten(state, prefix="", flat=None):
+    """Turn nested state into dict of dotted field names and values."""
+    if flat is None:
+        flat = {}
+
+    for key, value in state.items():
+        if isinstance(value, dict):
+            flatten(value, f"{prefix}{key}.", flat)
+        else:
+            flat[f"{prefix}{key}"] = value
+
+    return flat
+
+
+def _differs(old, new):
+    """Check if value changed, telling apart True from 1 as JSON does."""
+    return old is _MISSING or type(old) is not type(new) or old != new
+
+
+class HouseHistory:
+    """Keeps recent state changes of one house.
+
+    Every change stores only fields that differ from the previous state.
+    Every ``KEYFRAME_INTERVAL``-th change also has the full state before it,
+    and changes are dropped in whole keyframe spans, so the oldest kept
+    change always has its keyframe.
+    """
+
+    def __init__(self, size):
+        """Initiate empty history holding up to size changes."""
+        self._size = max(size, KEYFRAME_INTERVAL)
+        # Drop an eighth at once, so dropping is amortized and spills batched
+        self._drop = max(self._size // 8 // KEYFRAME_INTERVAL, 1) * KEYFRAME_INTERVAL
+        self._timestamps = []
+        self._changes = []
+        self._keyframes = []
+        self._current = {}
+        self.dropped_until = None
+
+    def append(self, timestamp, flat):
+        """Record new flattened state, return list of dropped changes."""
+        # Removed fields stay in current state as None, removed only once
+        changes = tuple(
+            (field, value)
+            for field, value in flat.items()
+            if _differs(self._current.get(field, _MISSING), value)
+        ) + tuple(
+            (field, None)
+            for field, value in self._current.items()
+            if value is not None and field not in flat
+        )
+
+        if not changes:
+            return []
+
+        # Wall clock can step back, while lookups need sorted timestamps
+        if self._timestamps and timestamp < self._timestamps[-1]:
+            timestamp = self._timestamps[-1]
+
+        if len(self._timestamps) % KEYFRAME_INTERVAL == 0:
+            self._keyframes.append(dict(self._current))
+
+        self._timestamps.append(timestamp)
+        self._changes.append(changes)
+        self._current.update(changes)
+
+        if len(self._timestamps) <= self._size:
+            return []
+
+        dropped = list(zip(self._timestamps[: self._drop], self._changes[: self._drop]))
+        del self._timestamps[: self._drop]
+        del self._changes[: self._drop]
+        del self._keyframes[: self._drop // KEYFRAME_INTERVAL]
+        self.dropped_until = dropped[-1][0]
+
+        return dropped
+
+    def _state_before(self, index):
+        """Rebuild full state before change at index from nearest keyframe."""
+        if index == len(self._timestamps):
+            return dict(self._current)
+
+        start = index - index % KEYFRAME_INTERVAL
+        state = dict(self._keyframes[index // KEYFRAME_INTERVAL])
+        for changes in self._changes[start:index]:
+            state.update(changes)
+
+        return state
+
+    def query(self, start, end, resolution=None):
+        """Get state at start and series of field values until end.
+
+        With resolution changes are grouped into buckets of that many seconds
+        counted from start, each reporting field values at its end. Buckets
+        without changes are left out, values carry over from previous ones.
+        """
+        low = bisect_left(self._timestamps, start)
+        high = bisect_right(self._timestamps, end)
+        state = self._state_before(low)
+        initial = {field: value for field, value in state.items() if value is not None}
+        series = {}
+        changes = []
+
+        index = low
+        while index < high:
+            if resolution is None:
+                bucket = self._timestamps[index]
+                bucket_end = index + 1
+            else:
+                buckets = floor((self._timestamps[index] - start) / resolution)
+                bucket = start + buckets * resolution
+                bucket_end = bisect_left(
+                    self._timestamps, bucket + resolution, index, high
+                )
+
+            # Only fields touched in bucket can have a new value at its end
+            before = {}
+            for bucket_changes in self._changes[index:bucket_end]:
+                for field, value in bucket_changes:
+                    before.setdefault(field, state.get(field, _MISSING))
+                    state[field] = value
+
+            for field, value in before.items():
+                if _differs(value, state[field]):
+                    series.setdefault(field, []).append([bucket, state[field]])
+            changes.append([bucket, bucket_end - index])
+
+            index = bucket_end
+
+        return {
+            "truncated": self.dropped_until is not None and self.dropped_until >= start,
+            "initial": initial,
+            "series": series,
+            "changes": changes,
+        }
+
+
+class StateHistory:
+    """Keeps bounded histories of state changes of all houses.
+
+    Memory per house stays fixed by ``size``. With ``spill_dir`` changes
+    dropped from memory are appended to ``<unique_id>.jsonl`` in it.
+
+    Histories live in memory of one process. Under gunicorn every worker
+    only keeps changes made through it, so history of a house is partial
+    unless the hub runs a single worker.
+    """
+
+    def __init__(self, size=HISTORY_SIZE, spill_dir=HISTORY_DIR):
+        """Initiate empty histories."""
+        self._size = size
+        self._spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._houses = {}
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def record(self, record, timestamp=None):
+        """Append state and global alarm flag of house record to its history."""
+        flat = flatten(record.get("state") or {})
+        flat["global_alarm"] = record.get("global_alarm", False)
+        unique_id = record["unique_id"]
+
+        with self._lock:
+            history = self._houses.get(unique_id)
+            if history is None:
+                history = self._houses[unique_id] = HouseHistory(self._size)
+
+            dropped = history.append(timestamp or time(), flat)
+
+        # Changes of a house are recorded under its store lock, keeping order
+        if dropped and self._spill_dir:
+            self._spill(unique_id, dropped)
+
+    def _spill(self, unique_id, dropped):
+        """Append dropped changes to spill file of a house."""
+        lines = "".join(
+            json.dumps({"timestamp": timestamp, "changes": dict(changes)}) + "\n"
+            for timestamp, changes in dropped
+        )
+
+        with open(os.path.join(self._spill_dir, f"{unique_id}.jsonl"), "a") as spill:
+            spill.write(lines)
+
+    def query(self, unique_id, start, end, resolution=None):
+        """Get history of a house as ``HouseHistory.query``, None if unknown."""
+        with self._lock:
+            history = self._houses.get(unique_id)
+            if history is None:
+                return None
+
+            return history.query(start, end, resolution)
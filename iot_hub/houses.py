@@ -1,10 +1,25 @@
 """Defines CRUD operations with house models."""
+import json
+import os
 from datetime import datetime
+from time import time
 
-from flask import abort, make_response
+from defaults import DEFAULT_STATE
 
+from flask import abort, make_response, request
 
-HOUSES = {
+from history import StateHistory, flatten
+
+from metrics import ALARM_FANOUT
+
+from notify import Notifier
+
+from shards import owns
+
+from store import INDEXED_COLUMNS, make_store
+
+
+DEMO_HOUSES = {
     "1337CAFEC0DE": {
         "unique_id": "1337CAFEC0DE",
         "ip_address": "192.168.1.42",
@@ -15,35 +30,7 @@ HOUSES = {
         "timestamp_deleted": "",
         "update_from_ui": False,
         "global_alarm": False,
-        "state": {
-            "alarm": {
-                "triggered": False,
-                "armed": False,
-                "mode": 0,
-                "armed_timestamp": 0,
-                "triggered_timestamp": 0,
-                "disarmed_timestamp": 0,
-            },
-            "buzzer": {
-                "active": False,
-                "timestamp": 0,
-            },
-            "fan": {
-                "active": False,
-                "clockwise": True,
-                "timestamp": 0,
-            },
-            "led": {
-                "active": False,
-                "timestamp": 0,
-            },
-            "motion": {
-                "motion_detected": False,
-                "triggered_timestamp": 0,
-                "released_timestamp": 0,
-            },
-            "wall_msg": "ID:1337CAFECODE",
-        },
+        "state": {**DEFAULT_STATE, "wall_msg": "ID:1337CAFECODE"},
     },
     "1337C0FFFEEE": {
         "unique_id": "1337C0FFFEEE",
@@ -55,47 +42,152 @@ HOUSES = {
         "timestamp_deleted": "",
         "update_from_ui": False,
         "global_alarm": False,
-        "state": {
-            "alarm": {
-                "triggered": False,
-                "armed": False,
-                "mode": 0,
-                "armed_timestamp": 0,
-                "triggered_timestamp": 0,
-                "disarmed_timestamp": 0,
-            },
-            "buzzer": {
-                "active": False,
-                "timestamp": 0,
-            },
-            "fan": {
-                "active": False,
-                "clockwise": True,
-                "timestamp": 0,
-            },
-            "led": {
-                "active": False,
-                "timestamp": 0,
-            },
-            "motion": {
-                "motion_detected": False,
-                "triggered_timestamp": 0,
-                "released_timestamp": 0,
-            },
-            "wall_msg": "ID:1337C0FFFEEE",
-        },
+        "state": {**DEFAULT_STATE, "wall_msg": "ID:1337C0FFFEEE"},
     },
 }
 
 
-def get_timestamp():
+# Sharded hubs only seed demo houses they own
+STORE = make_store(
+    os.environ.get("IOT_HUB_STORE", "memory://"),
+    seed={uid: house for uid, house in DEMO_HOUSES.items() if owns(uid)},
+)
+
+# Seconds without keepalive after which watchdog marks a house as Lost
+KEEPALIVE_TIMEOUT_S = float(os.environ.get("IOT_HUB_KEEPALIVE_TIMEOUT_S", 60))
+
+# Keepalive intervals hinted to houses, idle ones and ones used from UI lately
+KEEPALIVE_INTERVAL_S = float(os.environ.get("IOT_HUB_KEEPALIVE_INTERVAL_S", 10))
+KEEPALIVE_ACTIVE_INTERVAL_S = float(
+    os.environ.get("IOT_HUB_KEEPALIVE_ACTIVE_INTERVAL_S", 1)
+)
+
+# Seconds after device set from UI during which a house counts as in use
+UI_ACTIVITY_WINDOW_S = 60
+
+# Hinted intervals a house may miss before it is Lost, if above the timeout
+LOST_AFTER_INTERVALS = 3
+
+# Seconds between store re-checks of a waiting long-poll keepalive
+LONG_POLL_RECHECK_S = 1
+
+# Commands queued per house, beyond that the house pulls its full state
+COMMAND_QUEUE_SIZE = 32
+
+NOTIFIER = Notifier()
+
+HISTORY = StateHistory()
+
+
+def get_timestamp(epoch=None):
     """Provide human-readable timestamp."""
-    return datetime.now().strftime(("%Y-%m-%d %H:%M:%S"))
+    return datetime.fromtimestamp(epoch or time()).strftime(("%Y-%m-%d %H:%M:%S"))
+
+
+def _project(houses, fields):
+    """Keep only listed fields of houses, dotted names pick nested fields."""
+    if not fields:
+        return houses
+
+    paths = [field.split(".") for field in fields.split(",")]
+    projected_houses = []
+
+    for house in houses:
+        projected = {}
+
+        for path in paths:
+            value = house
+
+            for key in path:
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                target = projected
+                for key in path[:-1]:
+                    target = target.setdefault(key, {})
+                target[path[-1]] = value
+
+        projected_houses.append(projected)
+
+    return projected_houses
+
+
+def _json_response(body, status):
+    """Make response from already encoded JSON bytes."""
+    return make_response(body, status, {"Content-Type": "application/json"})
+
+
+def _houses_json(houses, fields):
+    """Encode houses as JSON array, joining cached fragments if not projected."""
+    if fields:
+        projected = _project(houses, fields)
+        return json.dumps(projected, separators=(",", ":")).encode("utf-8")
+
+    return b"[" + b",".join(STORE.house_json(house) for house in houses) + b"]"
+
+
+def read_all(
+    since=None,
+    limit=None,
+    cursor=None,
+    status=None,
+    armed=None,
+    lost_since=None,
+    fields=None,
+):
+    """Get the list of registered houses.
+
+    With ``since`` only houses changed after that store version are returned,
+    together with the version to pass as ``since`` next time. With any of
+    ``limit``, ``cursor``, ``status``, ``armed``, ``lost_since`` or ``fields``
+    a page of matching houses is returned, together with ``next_cursor``
+    to continue from. All variants carry store version as ``ETag`` and answer
+    ``If-None-Match`` with 304.
+    """
+    # Read version before records, so no change can slip between the two
+    version = STORE.version
+    etag = str(version)
+
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    elif since is not None:
+        response = _json_response(
+            b'{"version":%d,"houses":%s}'
+            % (version, _houses_json(STORE.changed_since(since), fields)),
+            200,
+        )
+    elif (limit, cursor, status, armed, lost_since, fields) == (None,) * 6:
+        response = _json_response(_houses_json(STORE.values(), None), 200)
+    else:
+        criteria = {}
+        minimum = {}
+
+        if status is not None:
+            criteria["status"] = status
+        if armed is not None:
+            criteria["alarm_armed"] = armed
+        if lost_since is not None:
+            criteria.setdefault("status", "Lost")
+            minimum["timestamp_lost_epoch"] = lost_since
+
+        houses = STORE.query(cursor=cursor, limit=limit, minimum=minimum, **criteria)
+        full_page = limit is not None and len(houses) == limit
+        next_cursor = houses[-1]["unique_id"] if full_page else None
+
+        response = _json_response(
+            b'{"version":%d,"houses":%s,"next_cursor":%s}'
+            % (
+                version,
+                _houses_json(houses, fields),
+                json.dumps(next_cursor).encode("utf-8"),
+            ),
+            200,
+        )
 
+    response.set_etag(etag)
 
-def read_all():
-    """Get the list of registered houses."""
-    return list(HOUSES.values())
+    return response
 
 
 def create(house):
@@ -103,20 +195,25 @@ def create(house):
     unique_id = house.get("unique_id")
     ip_address = house.get("ip_address", "")
     state = house.get("state")
-    action_timestamp = get_timestamp()
+    action_epoch = time()
+    action_timestamp = get_timestamp(action_epoch)
 
-    HOUSES[unique_id] = {
-        "unique_id": unique_id,
-        "ip_address": ip_address,
-        "status": "Registered",
-        "timestamp_keepalive": action_timestamp,
-        "timestamp_created": action_timestamp,
-        "timestamp_modified": "",
-        "timestamp_deleted": "",
-        "update_from_ui": False,
-        "global_alarm": False,
-        "state": state,
-    }
+    STORE.put(
+        {
+            "unique_id": unique_id,
+            "ip_address": ip_address,
+            "status": "Registered",
+            "timestamp_keepalive": action_timestamp,
+            "timestamp_keepalive_epoch": action_epoch,
+            "keepalive_deadline": action_epoch + KEEPALIVE_TIMEOUT_S,
+            "timestamp_created": action_timestamp,
+            "timestamp_modified": "",
+            "timestamp_deleted": "",
+            "update_from_ui": False,
+            "global_alarm": False,
+            "state": state,
+        }
+    )
 
     return make_response(
         {
@@ -127,95 +224,178 @@ def create(house):
     )
 
 
-def keepalive(unique_id, house):
-    """Update keepalive timestamp of a house in IoT hub records."""
-    ip_address = house.get("ip_address", "")
+def _wait_for_update(unique_id, wait):
+    """Wait until house has alarm, commands or UI update pending or wait expires."""
+    wait_deadline = time() + wait
+    wakeup = NOTIFIER.subscribe(unique_id)
+
+    try:
+        while True:
+            record = STORE.get(unique_id)
+            remaining = wait_deadline - time()
+
+            if (
+                record["global_alarm"]
+                or record["update_from_ui"]
+                or record.get("commands")
+                or remaining <= 0
+            ):
+                return
+
+            # Re-check store now and then for changes made by other processes
+            wakeup.wait(min(remaining, LONG_POLL_RECHECK_S))
+            wakeup.clear()
+    finally:
+        NOTIFIER.unsubscribe(unique_id, wakeup)
+
+
+def _keepalive_interval(record, now):
+    """Pick keepalive interval to hint to a house, short while used from UI.
+
+    Houses narrow the interval on local activity by themselves.
+    """
+    if (
+        record["update_from_ui"]
+        or record["global_alarm"]
+        or record.get("commands")
+        or now - record.get("timestamp_ui_epoch", 0) < UI_ACTIVITY_WINDOW_S
+    ):
+        return KEEPALIVE_ACTIVE_INTERVAL_S
+
+    return KEEPALIVE_INTERVAL_S
+
+
+def _process_keepalive(unique_id, ip_address, wait=0, ack=None):
+    """Record keepalive of a house and get response body with status code.
+
+    Commands up to sequence number ``ack`` are dropped from the queue of the
+    house as applied. The house is Lost only after missing a few of the
+    keepalive intervals hinted to it, if that is longer than the usual
+    timeout. Returns None if the house is not found.
+    """
+    with STORE.lock(unique_id):
+        record = STORE.get(unique_id)
+
+        if record is None:
+            return None
+
+        keepalive_epoch = time()
+        interval_s = _keepalive_interval(record, keepalive_epoch)
+        lost_after_s = max(KEEPALIVE_TIMEOUT_S, LOST_AFTER_INTERVALS * interval_s)
+        keepalive_fields = {
+            "ip_address": ip_address,
+            "status": "Active",
+            "timestamp_keepalive": get_timestamp(keepalive_epoch),
+            "timestamp_keepalive_epoch": keepalive_epoch,
+            "keepalive_deadline": keepalive_epoch + lost_after_s + wait,
+        }
+
+        commands = record.get("commands")
+        acked = ack is not None and bool(commands) and commands[0]["seq"] <= ack
+
+        # Plain heartbeats only touch keepalive fields, which stores write in bulk
+        if record["status"] != "Active" or record["ip_address"] != ip_address or acked:
+            if acked:
+                record["commands"] = [c for c in commands if c["seq"] > ack]
+            record.update(keepalive_fields)
+            STORE.put(record)
+        else:
+            STORE.touch(unique_id, keepalive_fields)
 
-    if unique_id in HOUSES:
-        HOUSES[unique_id].update(
-            {
-                "ip_address": ip_address,
-                "status": "Active",
-                "timestamp_keepalive": get_timestamp(),
-            }
-        )
+        if not wait:
+            return _keepalive_reply(record, wait)
 
-        if HOUSES[unique_id]["global_alarm"]:
-            HOUSES[unique_id]["global_alarm"] = False
+    # Wait without holding the lock, so updates can reach the house
+    _wait_for_update(unique_id, wait)
 
-            return make_response(
-                {
-                    "message": "Keepalive received, activate alarm now",
-                    "unique_id": unique_id,
-                },
-                202,
-            )
+    with STORE.lock(unique_id):
+        return _keepalive_reply(STORE.get(unique_id), wait)
 
-        if HOUSES[unique_id]["update_from_ui"]:
-            return make_response(
-                {
-                    "message": "Keepalive received, state update available",
-                    "unique_id": unique_id,
-                },
-                205,
-            )
 
-        else:
-            return make_response(
-                {
-                    "message": "Keepalive received, no state update to report",
-                    "unique_id": unique_id,
-                },
-                200,
-            )
+def _keepalive_reply(record, wait):
+    """Pick keepalive response for a house, clearing delivered updates.
 
-    else:
-        abort(
-            404,
+    Every response hints the interval of keepalives the house should keep,
+    picked from the record as it is when answering, after any long-poll wait.
+    Must be called holding the lock of the house.
+    """
+    unique_id = record["unique_id"]
+    interval_s = _keepalive_interval(record, time())
+
+    if record["global_alarm"]:
+        record["global_alarm"] = False
+        STORE.put(record)
+        HISTORY.record(record)
+
+        return (
             {
-                "message": "House not found",
+                "message": "Keepalive received, activate alarm now",
                 "unique_id": unique_id,
+                "interval_s": interval_s,
             },
+            202,
         )
 
+    if record["update_from_ui"] and wait:
+        # Full state already carries effects of queued commands
+        record["update_from_ui"] = False
+        record["commands"] = []
+        STORE.put(record)
 
-def delete(unique_id):
-    """Delete a house from the IoT hub."""
-    if unique_id in HOUSES:
-        HOUSES[unique_id].update(
+        return (
             {
-                "status": "Deleted",
-                "timestamp_deleted": get_timestamp(),
-            }
+                "message": "Keepalive received, state update attached",
+                "unique_id": unique_id,
+                "interval_s": interval_s,
+                "state": record["state"],
+            },
+            205,
         )
 
-        return make_response(
+    if record["update_from_ui"]:
+        return (
             {
-                "message": "House de-activated successfully",
+                "message": "Keepalive received, state update available",
                 "unique_id": unique_id,
+                "interval_s": interval_s,
             },
-            200,
+            205,
         )
-    else:
-        abort(
-            404,
+
+    # Commands stay queued and are sent again until acknowledged
+    if record.get("commands"):
+        return (
             {
-                "message": "House not found",
+                "message": "Keepalive received, commands attached",
                 "unique_id": unique_id,
+                "interval_s": interval_s,
+                "commands": record["commands"],
             },
+            205,
         )
 
+    return (
+        {
+            "message": "Keepalive received, no state update to report",
+            "unique_id": unique_id,
+            "interval_s": interval_s,
+        },
+        200,
+    )
 
-def get_state(unique_id):
-    """Get house data from the IoT hub."""
-    if unique_id in HOUSES and HOUSES[unique_id]["status"] != "Deleted":
-        if HOUSES[unique_id]["update_from_ui"]:
-            HOUSES[unique_id]["update_from_ui"] = False
 
-        return make_response(
-            HOUSES[unique_id]["state"],
-            200,
-        )
+def keepalive(unique_id, house, wait=0, ack=None):
+    """Update keepalive timestamp of a house in IoT hub records.
+
+    With ``wait`` above zero the response is held for up to that many seconds
+    until an alarm, commands or UI update is pending, and the updated state is
+    returned right in the response. Pending commands are returned in order
+    until acknowledged with sequence number of the last applied one in ``ack``.
+    """
+    result = _process_keepalive(unique_id, house.get("ip_address", ""), wait, ack)
+
+    if result is not None:
+        return make_response(*result)
     else:
         abort(
             404,
@@ -226,55 +406,294 @@ def get_state(unique_id):
         )
 
 
+def keepalive_batch(houses):
+    """Update keepalive timestamps of many houses at once.
+
+    Returns status codes in the order of received houses, each one matching
+    what ``keepalive`` would answer for that house alone.
+    """
+    codes = []
+
+    for house in houses:
+        result = _process_keepalive(
+            house["unique_id"], house.get("ip_address", ""), ack=house.get("ack")
+        )
+        codes.append(404 if result is None else result[1])
+
+    return make_response({"codes": codes}, 200)
+
+
+def delete(unique_id):
+    """Delete a house from the IoT hub."""
+    with STORE.lock(unique_id):
+        record = STORE.get(unique_id)
+
+        if record is not None:
+            record.update(
+                {
+                    "status": "Deleted",
+                    "timestamp_deleted": get_timestamp(),
+                }
+            )
+            STORE.put(record)
+
+            return make_response(
+                {
+                    "message": "House de-activated successfully",
+                    "unique_id": unique_id,
+                },
+                200,
+            )
+        else:
+            abort(
+                404,
+                {
+                    "message": "House not found",
+                    "unique_id": unique_id,
+                },
+            )
+
+
+def get_state(unique_id):
+    """Get house data from the IoT hub."""
+    with STORE.lock(unique_id):
+        record = STORE.get(unique_id)
+
+        if record is not None and record["status"] != "Deleted":
+            # Full state already carries effects of queued commands
+            if record["update_from_ui"] or record.get("commands"):
+                record["update_from_ui"] = False
+                record["commands"] = []
+                STORE.put(record)
+
+            return _json_response(STORE.state_json(unique_id), 200)
+        else:
+            abort(
+                404,
+                {
+                    "message": "House not found",
+                    "unique_id": unique_id,
+                },
+            )
+
+
 def set_state(unique_id, house):
     """Set house data in the IoT hub."""
     state = house.get("state")
-    if unique_id in HOUSES:
-        HOUSES[unique_id].update(
-            {
-                "state": state,
-                "timestamp_modified": get_timestamp(),
-            }
-        )
+    with STORE.lock(unique_id):
+        record = STORE.get(unique_id)
 
-        return make_response(
-            {
-                "message": "House state updated successfully",
-                "unique_id": unique_id,
-            },
-            200,
-        )
-    else:
-        abort(
-            404,
-            {
-                "message": "House not found",
-                "unique_id": unique_id,
-            },
-        )
+        if record is not None:
+            record.update(
+                {
+                    "state": state,
+                    "timestamp_modified": get_timestamp(),
+                }
+            )
+            STORE.put(record)
+            HISTORY.record(record)
+
+            return make_response(
+                {
+                    "message": "House state updated successfully",
+                    "unique_id": unique_id,
+                },
+                200,
+            )
+        else:
+            abort(
+                404,
+                {
+                    "message": "House not found",
+                    "unique_id": unique_id,
+                },
+            )
+
+
+def _merge_patch(target, patch):
+    """Apply JSON merge patch (RFC 7396) to target and return the result."""
+    if not isinstance(patch, dict):
+        return patch
+
+    if not isinstance(target, dict):
+        target = {}
+
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = _merge_patch(target.get(key), value)
+
+    return target
+
+
+def patch_state(unique_id, patch):
+    """Merge changed part of house state into the IoT hub records."""
+    with STORE.lock(unique_id):
+        record = STORE.get(unique_id)
+
+        if record is not None:
+            record.update(
+                {
+                    "state": _merge_patch(record["state"], patch),
+                    "timestamp_modified": get_timestamp(),
+                }
+            )
+            STORE.put(record)
+            HISTORY.record(record)
+
+            return make_response(
+                {
+                    "message": "House state updated successfully",
+                    "unique_id": unique_id,
+                },
+                200,
+            )
+        else:
+            abort(
+                404,
+                {
+                    "message": "House not found",
+                    "unique_id": unique_id,
+                },
+            )
+
+
+def _set_device(record, device, active):
+    """Set device state in house record and queue command for the house."""
+    record["state"][device]["active"] = active
+    record["state"][device]["timestamp"] = datetime.now().timestamp()
+
+    command_seq = record.get("command_seq", 0) + 1
+    commands = record.get("commands") or []
+    commands.append({"seq": command_seq, "device": device, "active": active})
+
+    # House too far behind pulls its full state instead
+    if len(commands) > COMMAND_QUEUE_SIZE:
+        commands = []
+        record["update_from_ui"] = True
+
+    record.update(
+        {
+            "commands": commands,
+            "command_seq": command_seq,
+            "timestamp_modified": get_timestamp(),
+            "timestamp_ui_epoch": time(),
+        }
+    )
 
 
 def toggle_device(unique_id, device):
-    """Toggle device state for a house."""
-    if unique_id in HOUSES:
-        device_state = HOUSES[unique_id]["state"][device]["active"]
-        HOUSES[unique_id]["state"][device]["active"] = not device_state
-        HOUSES[unique_id]["state"][device]["timestamp"] = datetime.now().timestamp()
+    """Toggle device state for a house and queue command for the house."""
+    with STORE.lock(unique_id):
+        record = STORE.get(unique_id)
+
+        if record is not None:
+            _set_device(record, device, not record["state"][device]["active"])
+            STORE.put(record)
+            HISTORY.record(record)
+            NOTIFIER.notify(unique_id)
+
+            return make_response(
+                {
+                    "message": f"Device {device.capitalize()} toggled successfully",
+                    "unique_id": unique_id,
+                },
+                200,
+            )
+        else:
+            abort(
+                404,
+                {
+                    "message": "House not found",
+                    "unique_id": unique_id,
+                },
+            )
+
+
+def bulk_device(operation):
+    """Set device state of many houses at once.
+
+    Houses are picked by ``unique_ids``, ``status`` and ``alarm_mode``, all
+    given ones have to match. Filters alone are served from store indexes.
+    Every changed house gets a command queued like for ``toggle_device``.
+    """
+    device = operation["device"]
+    active = operation["active"]
+    criteria = {
+        column: operation[column]
+        for column in ("status", "alarm_mode")
+        if column in operation
+    }
+
+    if "unique_ids" in operation:
+        targets = list(dict.fromkeys(operation["unique_ids"]))
+    else:
+        targets = STORE.select(**criteria)
+
+    result = {"matched": 0, "changed": 0, "unchanged": 0, "not_found": 0}
+
+    for unique_id in targets:
+        with STORE.lock(unique_id):
+            record = STORE.get(unique_id)
+
+            if record is None or record["status"] == "Deleted":
+                result["not_found"] += 1
+                continue
+
+            # Re-checked under lock, house could have changed since selected
+            if device not in (record["state"] or {}) or any(
+                INDEXED_COLUMNS[column](record) != value
+                for column, value in criteria.items()
+            ):
+                continue
+
+            result["matched"] += 1
+            if record["state"][device]["active"] == active:
+                result["unchanged"] += 1
+                continue
+
+            _set_device(record, device, active)
+            STORE.put(record)
+            HISTORY.record(record)
+
+        NOTIFIER.notify(unique_id)
+        result["changed"] += 1
+
+    result["message"] = f"Device {device.capitalize()} set for matching houses"
+
+    return make_response(result, 200)
 
-        HOUSES[unique_id].update(
-            {
-                "update_from_ui": True,
-                "timestamp_modified": get_timestamp(),
-            }
-        )
 
-        return make_response(
+def history(unique_id, resolution=None, **window):
+    """Get downsampled history of house state changes.
+
+    ``from`` and ``to`` of ``window`` bound the period in Unix time, taking
+    the whole kept history and now by default.
+    """
+    record = STORE.get(unique_id)
+
+    if record is not None:
+        start = window.get("from", 0)
+        end = window.get("to", time())
+        result = HISTORY.query(unique_id, start, end, resolution)
+
+        # Nothing changed since the hub started
+        if result is None:
+            state = flatten(record.get("state") or {})
+            state["global_alarm"] = record.get("global_alarm", False)
+            result = {"truncated": False, "initial": state, "series": {}, "changes": []}
+
+        result.update(
             {
-                "message": f"Device {device.capitalize()} toggled successfully",
                 "unique_id": unique_id,
-            },
-            200,
+                "from": start,
+                "to": end,
+                "resolution": resolution,
+            }
         )
+
+        return make_response(result, 200)
     else:
         abort(
             404,
@@ -285,28 +704,43 @@ def toggle_device(unique_id, device):
         )
 
 
+def _fan_out_alarm(origin):
+    """Trigger global alarm of subscribed houses except origin, return count."""
+    others = [house for house in STORE.select(alarm_subscriber=True) if house != origin]
+
+    for house in others:
+        with STORE.lock(house):
+            other = STORE.get(house)
+            if other is None:
+                continue
+            other.update(
+                {
+                    "global_alarm": True,
+                    "timestamp_modified": get_timestamp(),
+                }
+            )
+            STORE.put(other)
+            HISTORY.record(other)
+        NOTIFIER.notify(house)
+
+    return len(others)
+
+
 def report_alarm(unique_id):
     """Receive alarm report for a house and trigger other global alarms."""
-    if unique_id in HOUSES:
-        if HOUSES[unique_id]["state"]["alarm"]["mode"] == 2:  # ALARM_MODE_GLOBAL
-            for house in HOUSES:
-                if (
-                    house != unique_id and HOUSES[house]["state"]["alarm"]["mode"] == 2
-                ):  # ALARM_MODE_GLOBAL
-                    HOUSES[house].update(
-                        {
-                            "global_alarm": True,
-                            "timestamp_modified": get_timestamp(),
-                        }
-                    )
-
-        return make_response(
-            {
-                "message": "Alarm report processed successfully",
-                "unique_id": unique_id,
-            },
-            200,
-        )
+    record = STORE.get(unique_id)
+
+    if record is not None:
+        result = {
+            "message": "Alarm report processed successfully",
+            "unique_id": unique_id,
+        }
+
+        if record["state"]["alarm"]["mode"] == 2:  # ALARM_MODE_GLOBAL
+            result["fanout"] = _fan_out_alarm(unique_id)
+            ALARM_FANOUT.observe(value=result["fanout"])
+
+        return make_response(result, 200)
     else:
         abort(
             404,
@@ -315,3 +749,18 @@ def report_alarm(unique_id):
                 "unique_id": unique_id,
             },
         )
+
+
+def global_alarm(unique_id):
+    """Trigger global alarm of houses on this hub for alarm of another shard."""
+    fanout = _fan_out_alarm(unique_id)
+    ALARM_FANOUT.observe(value=fanout)
+
+    return make_response(
+        {
+            "message": "Global alarm triggered successfully",
+            "unique_id": unique_id,
+            "fanout": fanout,
+        },
+        200,
+    )
@@ -0,0 +1,38 @@
+"""Provides leader election between hub worker processes."""
+import fcntl
+
+
+class LeaderLock:
+    """Elects one leader process by holding an exclusive lock on a file.
+
+    The lock is released by the operating system when the leader exits, so
+    another process takes over on its next ``acquire`` attempt.
+    """
+
+    def __init__(self, path):
+        """Initiate lock for given file path."""
+        self._path = path
+        self._file = None
+
+    def acquire(self):
+        """Try to become leader without blocking, return True if leading."""
+        if self._file is not None:
+            return True
+
+        lock_file = open(self._path, "a")  # noqa: SIM115
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        self._file = lock_file
+
+        return True
+
+    def release(self):
+        """Step down as leader."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,652 @@
+"""Simulate a fleet of Smart House clients against a running IoT hub.
+
+Every virtual house replays the call pattern of ``smart_house/core/app.py``:
+it registers, sends keepalive every interval, applies commands or pulls
+state on 205, pushes state on local changes and reports alarm when an alarm
+triggers outside of local mode. A dashboard task toggles devices of random
+houses like the UI, a few times per visit with ``--session-toggles``. With
+``--adaptive`` houses widen keepalive interval while idle up to the hub
+hint, like the firmware.
+
+All houses share a small pool of persistent connections, so one process can
+drive 100k houses. Start the hub first, then run from the ``iot_hub`` folder,
+e.g. ``python loadgen.py --houses 10000 --duration 60 http://127.0.0.1:80``.
+Hub started with ``IOT_HUB_SERVER_TIMING=1`` also reports mean validation
+time per operation.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from bisect import bisect_right
+from urllib.parse import urlsplit
+
+API_PATH = "/smarthouse/v1"
+
+# Keeps IDs of virtual houses apart from demo and real houses
+FIRST_UNIQUE_ID = 0xA00000000000
+
+ALARM_MODE_NONE = 0
+ALARM_MODE_LOCAL = 1
+ALARM_MODE_GLOBAL = 2
+ALARM_MODE_SENSOR = 3
+
+DEVICES = ("buzzer", "fan", "led")
+
+# Seconds between arrival of a toggle at house and the next one of the visit
+SESSION_TOGGLE_GAP_S = 2
+
+
+def server_timing(value, metric):
+    """Get duration of metric from ``Server-Timing`` header in seconds."""
+    for entry in value.split(","):
+        name, *params = entry.strip().split(";")
+        if name == metric:
+            for param in params:
+                key, _, duration = param.strip().partition("=")
+                if key == "dur":
+                    return float(duration) / 1000
+
+    return None
+
+
+def ticks_ms():
+    """Get milliseconds counter like ``time.ticks_ms`` of MicroPython."""
+    return int(time.monotonic() * 1000)
+
+
+def percentile(values, fraction):
+    """Pick value at given fraction of sorted values, 0 for empty list."""
+    if not values:
+        return 0
+
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Stats:
+    """Collects latencies, errors and alarm propagation delays."""
+
+    def __init__(self):
+        """Initiate empty statistics."""
+        self.latencies = {}
+        self.validations = {}
+        self.errors = {}
+        self.alarm_delays = []
+        self._alarm_origins = []
+        self.toggle_delays = ([], [])
+
+    def record(self, operation, latency, status, validation=None):
+        """Record one call of an operation, status None for failed calls.
+
+        Validation is the time hub spent validating the request, if reported.
+        """
+        self.latencies.setdefault(operation, []).append(latency)
+
+        if validation is not None:
+            self.validations.setdefault(operation, []).append(validation)
+
+        if status is None or status >= 400:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def alarm_reported(self, moment):
+        """Remember when an alarm started spreading from a house."""
+        self._alarm_origins.append(moment)
+
+    def alarm_received(self, moment):
+        """Record delay between latest alarm report and its arrival at a house."""
+        position = bisect_right(self._alarm_origins, moment)
+
+        if position:
+            self.alarm_delays.append(moment - self._alarm_origins[position - 1])
+
+    def toggle_applied(self, delay, follow_up):
+        """Record delay between dashboard toggle and its arrival at a house."""
+        self.toggle_delays[follow_up].append(delay)
+
+    def report(self, elapsed):
+        """Print throughput and latency percentiles per operation."""
+        print(
+            f"{'operationId':<22} {'calls':>8} {'rate/s':>9} {'errors':>7} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'valid. ms':>9}"
+        )
+
+        for operation in sorted(self.latencies):
+            latencies = sorted(self.latencies[operation])
+            validations = self.validations.get(operation)
+            print(
+                f"{operation:<22} {len(latencies):>8} "
+                f"{len(latencies) / elapsed:>9.1f} "
+                f"{self.errors.get(operation, 0):>7} "
+                f"{percentile(latencies, 0.50) * 1e3:>8.1f} "
+                f"{percentile(latencies, 0.95) * 1e3:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1e3:>8.1f} "
+                + (
+                    f"{sum(validations) / len(validations) * 1e3:>9.3f}"
+                    if validations
+                    else f"{'-':>9}"
+                )
+            )
+
+        delays = sorted(self.alarm_delays)
+        print(
+            f"global alarm propagation: received={len(delays)} "
+            f"p50={percentile(delays, 0.50) * 1e3:.0f}ms "
+            f"p95={percentile(delays, 0.95) * 1e3:.0f}ms "
+            f"p99={percentile(delays, 0.99) * 1e3:.0f}ms"
+        )
+
+        for name, delays in zip(("first", "follow-up"), self.toggle_delays):
+            delays = sorted(delays)
+            print(
+                f"dashboard toggle reaction, {name}: applied={len(delays)} "
+                f"p50={percentile(delays, 0.50) * 1e3:.0f}ms "
+                f"p95={percentile(delays, 0.95) * 1e3:.0f}ms"
+            )
+
+
+class ConnectionPool:
+    """Shares a fixed number of persistent HTTP/1.1 connections to the hub."""
+
+    def __init__(self, url, size, timeout):
+        """Initiate pool, connections are opened on first use."""
+        netloc = urlsplit(url)
+        self._host = netloc.hostname
+        self._port = netloc.port or 80
+        self._timeout = timeout
+        self._idle = asyncio.Queue()
+
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def _exchange(self, connection, method, path, payload, content_type):
+        """Send one request and read its response from the connection."""
+        reader, writer = connection
+        writer.write(
+            (
+                f"{method} {API_PATH}{path} HTTP/1.1\r\n"
+                f"Host: {self._host}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n"
+            ).encode("latin-1")
+            + payload
+        )
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Hub closed connection")
+
+        status = int(status_line.split()[1])
+        keep_alive = status_line.startswith(b"HTTP/1.1")
+        length = 0
+        validation = None
+
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection":
+                keep_alive = value.strip().lower() == "keep-alive"
+            elif name == "server-timing":
+                validation = server_timing(value, "validate")
+
+        body = await reader.readexactly(length) if length else b""
+
+        return status, body, keep_alive, validation
+
+    async def request(self, method, path, body=None, content_type="application/json"):
+        """Call hub API, return status code, decoded body and latency.
+
+        Also returns validation time reported by hub in ``Server-Timing``.
+        """
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        connection = await self._idle.get()
+
+        try:
+            started = time.perf_counter()
+
+            # Connection kept idle could have been closed by the hub meanwhile
+            for reused in (connection is not None, False):
+                if connection is None:
+                    connection = await asyncio.open_connection(self._host, self._port)
+
+                try:
+                    status, data, keep_alive, validation = await asyncio.wait_for(
+                        self._exchange(connection, method, path, payload, content_type),
+                        self._timeout,
+                    )
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    connection[1].close()
+                    connection = None
+                    if not reused:
+                        raise
+
+            latency = time.perf_counter() - started
+        except BaseException:  # noqa: B902
+            # Cancellation too must give the pool slot back, then it is re-raised
+            if connection is not None:
+                connection[1].close()
+            self._idle.put_nowait(None)
+            raise
+
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+
+        self._idle.put_nowait(connection)
+
+        try:
+            decoded = json.loads(data) if data else {}
+        except ValueError:
+            decoded = {}
+
+        return status, decoded, latency, validation
+
+    async def close(self):
+        """Close all idle connections."""
+        while not self._idle.empty():
+            connection = self._idle.get_nowait()
+            if connection is not None:
+                connection[1].close()
+
+
+class VirtualHouse:
+    """Replays hub calls of one Smart House App."""
+
+    def __init__(self, number, fleet):
+        """Initiate house with the state a freshly booted board reports."""
+        self.unique_id = f"{FIRST_UNIQUE_ID + number:012X}"
+        self.ip_address = f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}"
+        self.fleet = fleet
+        self.state = {
+            "alarm": {
+                "triggered": False,
+                "armed": False,
+                "mode": ALARM_MODE_NONE,
+                "armed_timestamp": 0,
+                "triggered_timestamp": 0,
+                "disarmed_timestamp": 0,
+            },
+            "buzzer": {"active": False, "timestamp": 0},
+            "fan": {"active": False, "clockwise": True, "timestamp": 0},
+            "led": {"active": False, "timestamp": 0},
+            "motion": {
+                "motion_detected": False,
+                "triggered_timestamp": 0,
+                "released_timestamp": 0,
+            },
+            "wall_msg": f"ID:{self.unique_id}",
+        }
+        # Sequence number of the last command applied
+        self.command_seq = 0
+        # Keepalive interval, widened while idle up to the hub hint if adaptive
+        self.interval_s = fleet.keepalive_interval_s
+        self.interval_hint_s = fleet.keepalive_interval_s
+        # Moments of dashboard toggles not applied yet, with follow-up flags
+        self.toggles = []
+
+    async def call(
+        self, operation, method, path, body=None, content_type="application/json"
+    ):
+        """Call hub API and record the outcome, return status and body."""
+        try:
+            status, data, latency, validation = await self.fleet.pool.request(
+                method, path, body, content_type
+            )
+        except (OSError, ValueError, asyncio.TimeoutError):
+            self.fleet.stats.record(operation, 0, None)
+            return None, {}
+
+        self.fleet.stats.record(operation, latency, status, validation)
+
+        return status, data
+
+    async def register(self):
+        """Check-in with hub like ``_iot_hub_register``."""
+        await self.call(
+            "houses.create",
+            "POST",
+            "/houses",
+            {
+                "unique_id": self.unique_id,
+                "ip_address": self.ip_address,
+                "state": self.state,
+            },
+        )
+
+    async def keepalive(self):
+        """Send keepalive and act on response like ``_iot_hub_keepalive``."""
+        wait = self.fleet.keepalive_wait
+        query = f"?ack={self.command_seq}" + (f"&wait={wait}" if wait else "")
+        status, data = await self.call(
+            "houses.keepalive",
+            "PUT",
+            f"/houses/{self.unique_id}/keepalive{query}",
+            {"unique_id": self.unique_id, "ip_address": self.ip_address},
+        )
+
+        if self.fleet.adaptive:
+            self.interval_hint_s = data.get("interval_s", self.interval_hint_s)
+            if status == 200:
+                self.interval_s = min(self.interval_s * 2, self.interval_hint_s)
+            else:
+                self.interval_s = self.fleet.keepalive_interval_s
+
+        if status == 202:
+            self.fleet.stats.alarm_received(time.perf_counter())
+            await self.trigger_alarm()
+
+        if status == 205:
+            if "commands" in data:
+                self.apply_commands(data["commands"])
+            elif "state" in data:
+                self.apply_state(data["state"])
+            else:
+                await self.get_state()
+
+    async def get_state(self):
+        """Pull state from hub like ``_iot_hub_get_state``."""
+        status, data = await self.call(
+            "houses.get_state", "GET", f"/houses/{self.unique_id}/state"
+        )
+
+        if status == 200:
+            self.apply_state(data)
+
+    def apply_commands(self, commands):
+        """Apply commands not applied yet, like ``_iot_hub_apply_commands``."""
+        for command in commands:
+            if command["seq"] > self.command_seq:
+                self.state[command["device"]]["active"] = command["active"]
+                self.command_seq = command["seq"]
+
+        self.toggles_applied()
+
+    def toggles_applied(self):
+        """Record reaction to dashboard toggles, all applied by now."""
+        now = time.perf_counter()
+        for moment, follow_up in self.toggles:
+            self.fleet.stats.toggle_applied(now - moment, follow_up)
+        self.toggles = []
+
+    def apply_state(self, state):
+        """Apply devices and wall message set from the dashboard."""
+        self.state["wall_msg"] = state.get("wall_msg", self.state["wall_msg"])
+
+        for device in DEVICES:
+            self.state[device]["active"] = state[device]["active"]
+
+        self.toggles_applied()
+
+    async def set_state(self, devices):
+        """Push changed devices to hub like ``_iot_hub_set_state``."""
+        await self.call(
+            "houses.patch_state",
+            "PATCH",
+            f"/houses/{self.unique_id}/state",
+            {device: self.state[device] for device in devices},
+            "application/merge-patch+json",
+        )
+
+    async def trigger_alarm(self):
+        """Handle triggered alarm like ``event_processor`` of ``/dev/alarm``."""
+        alarm = self.state["alarm"]
+        alarm.update({"triggered": True, "triggered_timestamp": ticks_ms()})
+
+        if alarm["mode"] not in (ALARM_MODE_LOCAL, ALARM_MODE_SENSOR):
+            await self.call(
+                "houses.report_alarm", "PUT", f"/houses/{self.unique_id}/report_alarm"
+            )
+
+            alarm.update(
+                {"armed": True, "mode": ALARM_MODE_LOCAL, "armed_timestamp": ticks_ms()}
+            )
+            await self.set_state(("alarm",))
+
+    async def change_locally(self):
+        """Run a random menu action or motion event, then push state."""
+        action = random.randrange(7)  # noqa: S311
+        alarm = self.state["alarm"]
+        changed = "alarm"
+
+        if action == 0:
+            alarm.update(
+                {
+                    "armed": False,
+                    "mode": ALARM_MODE_NONE,
+                    "disarmed_timestamp": ticks_ms(),
+                }
+            )
+        elif action in (1, 2):
+            alarm.update(
+                {
+                    "armed": True,
+                    "mode": ALARM_MODE_GLOBAL,
+                    "armed_timestamp": ticks_ms(),
+                }
+            )
+        elif action == 3:
+            alarm.update(
+                {"armed": True, "mode": ALARM_MODE_LOCAL, "armed_timestamp": ticks_ms()}
+            )
+        elif action == 4:
+            changed = "motion"
+            motion = self.state["motion"]
+            motion["motion_detected"] = not motion["motion_detected"]
+        else:
+            changed = random.choice(DEVICES)  # noqa: S311
+            self.state[changed]["active"] = not self.state[changed]["active"]
+
+        # Local activity brings keepalives back to the shortest interval
+        self.interval_s = self.fleet.keepalive_interval_s
+        await self.set_state((changed,))
+
+    async def run(self):
+        """Register, then interleave keepalives and local changes until stopped."""
+        fleet = self.fleet
+        loop = asyncio.get_running_loop()
+
+        # Spread boot of the fleet, so registration is not one burst
+        await asyncio.sleep(random.uniform(0, fleet.ramp_s))  # noqa: S311
+        await self.register()
+        fleet.registered.append(self)
+
+        first_keepalive_s = random.uniform(0, fleet.keepalive_interval_s)  # noqa: S311
+        next_keepalive = loop.time() + first_keepalive_s
+        next_change = loop.time() + random.expovariate(fleet.change_rate)
+
+        while True:
+            if fleet.keepalive_wait:
+                # Long-poll keepalives follow each other without a pause
+                await self.keepalive()
+            else:
+                await asyncio.sleep(
+                    max(0, min(next_keepalive, next_change) - loop.time())
+                )
+
+                if loop.time() >= next_keepalive:
+                    await self.keepalive()
+                    next_keepalive = max(next_keepalive + self.interval_s, loop.time())
+
+            if loop.time() >= next_change:
+                next_change = loop.time() + random.expovariate(fleet.change_rate)
+                await self.change_locally()
+                next_keepalive = min(next_keepalive, loop.time() + self.interval_s)
+
+    async def finalize(self):
+        """Check-out with hub like ``_iot_hub_finalize``."""
+        await self.call("houses.delete", "DELETE", f"/houses/{self.unique_id}")
+
+
+class Fleet:
+    """Runs virtual houses together with dashboard and alarm traffic."""
+
+    def __init__(self, args):
+        """Initiate fleet from command-line arguments."""
+        self.pool = ConnectionPool(args.url, args.connections, args.timeout)
+        self.stats = Stats()
+        self.keepalive_interval_s = args.keepalive_interval
+        self.keepalive_wait = args.wait
+        self.adaptive = args.adaptive
+        self.session_toggles = args.session_toggles
+        self.change_rate = args.change_rate
+        self.ramp_s = args.ramp
+        self.registered = []
+        self.houses = [VirtualHouse(number, self) for number in range(args.houses)]
+
+    async def _every(self, rate, action):
+        """Run action at random moments averaging ``rate`` times per second."""
+        tasks = set()
+
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            task = asyncio.create_task(action())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def toggle_device(self):
+        """Toggle devices of a random house from the dashboard, seconds apart."""
+        if not self.registered:
+            return
+
+        house = random.choice(self.registered)  # noqa: S311
+
+        for toggle in range(self.session_toggles):
+            if toggle:
+                # User sees previous toggle arrive before the next one
+                while house.toggles:
+                    await asyncio.sleep(0.1)
+                await asyncio.sleep(SESSION_TOGGLE_GAP_S)
+
+            device = random.choice(DEVICES)  # noqa: S311
+            moment = time.perf_counter()
+            status, _ = await house.call(
+                "houses.toggle_device",
+                "PUT",
+                f"/houses/{house.unique_id}/toggle_device/{device}",
+            )
+            if status == 200:
+                house.toggles.append((moment, toggle > 0))
+
+    async def raise_alarm(self):
+        """Trigger alarm of a random house armed in global mode by motion."""
+        armed = [
+            house
+            for house in self.registered
+            if house.state["alarm"]["armed"]
+            and house.state["alarm"]["mode"] == ALARM_MODE_GLOBAL
+        ]
+
+        if armed:
+            self.stats.alarm_reported(time.perf_counter())
+            await random.choice(armed).trigger_alarm()  # noqa: S311
+
+    async def run(self, duration, toggle_rate, alarm_rate, check_out):
+        """Drive the fleet for ``duration`` seconds and print statistics."""
+        tasks = [asyncio.create_task(house.run()) for house in self.houses]
+
+        if toggle_rate:
+            tasks.append(
+                asyncio.create_task(self._every(toggle_rate, self.toggle_device))
+            )
+        if alarm_rate:
+            tasks.append(asyncio.create_task(self._every(alarm_rate, self.raise_alarm)))
+
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.stats.report(elapsed)
+
+        if check_out:
+            await asyncio.gather(*(house.finalize() for house in self.registered))
+
+        await self.pool.close()
+
+
+def main():
+    """Load generator entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url", nargs="?", default="http://127.0.0.1:80")
+    parser.add_argument("--houses", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=64,
+        help="persistent connections shared by all houses, "
+        "with --wait use at least as many as houses",
+    )
+    parser.add_argument(
+        "--keepalive-interval",
+        type=float,
+        default=1,
+        help="seconds between keepalives, like update_interval_ms of firmware",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="widen keepalive interval while idle up to the hub hint",
+    )
+    parser.add_argument(
+        "--wait",
+        type=int,
+        default=0,
+        help="long-poll keepalives for up to that many seconds, "
+        "like keepalive_wait_s of firmware",
+    )
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=1 / 60,
+        help="local changes per house per second",
+    )
+    parser.add_argument(
+        "--toggle-rate",
+        type=float,
+        default=10,
+        help="dashboard visits toggling devices per second across the fleet",
+    )
+    parser.add_argument(
+        "--session-toggles",
+        type=int,
+        default=1,
+        help=f"toggles per dashboard visit, {SESSION_TOGGLE_GAP_S} seconds after "
+        "the previous one arrived",
+    )
+    parser.add_argument(
+        "--alarm-rate",
+        type=float,
+        default=0.1,
+        help="motion-triggered alarms per second across the fleet",
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=10, help="seconds to spread registration over"
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="seconds per call")
+    parser.add_argument(
+        "--check-out", action="store_true", help="delete houses from hub at the end"
+    )
+    args = parser.parse_args()
+
+    # Long-polled keepalive is held by the hub on top of the usual timeout
+    args.timeout += args.wait
+
+    fleet = Fleet(args)
+    asyncio.run(
+        fleet.run(args.duration, args.toggle_rate, args.alarm_rate, args.check_out)
+    )
+
+
+if __name__ == "__main__":
+    main()
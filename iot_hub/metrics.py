@@ -0,0 +1,233 @@
+"""Provides hub metrics in Prometheus text exposition format.
+
+Counters and histograms are updated in the request path, while house gauges
+come from counts the store keeps up to date on every write, so rendering
+does not depend on the number of houses.
+"""
+import threading
+from bisect import bisect_left
+
+from validation import STATS as VALIDATION_STATS
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of latency buckets in seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+
+# Upper bounds of global alarm fan-out buckets in houses
+FANOUT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# Store columns counted as house gauges
+COUNTED_COLUMNS = {
+    "status": ("iot_hub_houses", "Houses per status.", "status"),
+    "alarm_armed": ("iot_hub_houses_armed", "Houses with alarm armed.", None),
+    "alarm_triggered": ("iot_hub_houses_triggered", "Houses with alarm on.", None),
+}
+
+
+def _labels(names, values, extra=""):
+    """Format label set, escaping values as the exposition format requires."""
+    pairs = [
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    """Format sample value."""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        """Initiate counter without samples."""
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        """Increase counter of label values."""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        """Yield exposition lines of samples."""
+        with self._lock:
+            values = list(self._values.items())
+
+        for label_values, value in sorted(values):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Value per label values that goes up and down."""
+
+    kind = "gauge"
+
+    def set_value(self, *label_values, value):
+        """Set gauge of label values."""
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    """Cumulative histogram of observations per label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        """Initiate histogram without samples."""
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, *label_values, value):
+        """Add observation to histogram of label values."""
+        position = bisect_left(self._buckets, value)
+
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                # Per-bucket counts, then count above all buckets and sum
+                counts = self._values[label_values] = [0] * (len(self._buckets) + 1)
+                counts.append(0.0)
+            counts[position] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """Yield exposition lines of cumulative buckets, sum and count."""
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+
+        for label_values, counts in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self._buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            labels = _labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_number(counts[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+REQUESTS = Counter(
+    "iot_hub_requests_total",
+    "API requests served per operationId and status code.",
+    ("operation", "code"),
+)
+LATENCY = Histogram(
+    "iot_hub_request_duration_seconds",
+    "API request latency per operationId, long-polls included.",
+    ("operation",),
+)
+WATCHDOG_SWEEP = Gauge(
+    "iot_hub_watchdog_sweep_seconds",
+    "Duration of the latest watchdog sweep.",
+)
+WATCHDOG_LOST = Counter(
+    "iot_hub_watchdog_lost_total",
+    "Houses marked as Lost by watchdog.",
+)
+ALARM_FANOUT = Histogram(
+    "iot_hub_alarm_fanout_houses",
+    "Houses notified per global alarm report.",
+    buckets=FANOUT_BUCKETS,
+)
+
+METRICS = (REQUESTS, LATENCY, WATCHDOG_SWEEP, WATCHDOG_LOST, ALARM_FANOUT)
+
+
+def _family(name, kind, help_text, lines):
+    """Format metric family with its help and type comments."""
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *lines]
+
+
+def _house_gauges(store):
+    """Format house counts kept by store."""
+    counts = store.counts()
+    lines = []
+
+    for column, (name, help_text, label) in COUNTED_COLUMNS.items():
+        values = counts.get(column, {})
+
+        if label:
+            samples = [
+                f'{name}{{{label}="{key}"}} {count}'
+                for key, count in sorted(values.items())
+            ]
+        else:
+            samples = [f"{name} {values.get(True, 0)}"]
+
+        lines += _family(name, "gauge", help_text, samples)
+
+    return lines
+
+
+def _validation_counters():
+    """Format validation time recorded by request validators."""
+    stats = sorted(VALIDATION_STATS.snapshot().items())
+
+    return _family(
+        "iot_hub_validation_seconds_total",
+        "counter",
+        "Time spent validating requests per operationId.",
+        [
+            f'iot_hub_validation_seconds_total{{operation="{operation}"}} '
+            f"{_number(values['total_s'])}"
+            for operation, values in stats
+        ],
+    ) + _family(
+        "iot_hub_validation_runs_total",
+        "counter",
+        "Validator runs per operationId.",
+        [
+            f'iot_hub_validation_runs_total{{operation="{operation}"}} '
+            f"{values['count']}"
+            for operation, values in stats
+        ],
+    )
+
+
+def render(store):
+    """Render all metrics in text exposition format."""
+    lines = []
+
+    for metric in METRICS:
+        lines += _family(metric.name, metric.kind, metric.help_text, metric.samples())
+
+    lines += _house_gauges(store)
+    lines += _validation_counters()
+
+    return "\n".join(lines) + "\n"
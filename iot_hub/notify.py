@@ -0,0 +1,37 @@
+"""Provides wake-up signals for requests waiting on house changes."""
+import threading
+
+
+class Notifier:
+    """Wakes up long-poll requests waiting for changes of a house."""
+
+    def __init__(self):
+        """Initiate empty waiter registry."""
+        self._lock = threading.Lock()
+        self._waiters = {}
+
+    def subscribe(self, unique_id):
+        """Register waiter for a house and return its wake-up event."""
+        wakeup = threading.Event()
+
+        with self._lock:
+            self._waiters.setdefault(unique_id, set()).add(wakeup)
+
+        return wakeup
+
+    def unsubscribe(self, unique_id, wakeup):
+        """Remove waiter registered with ``subscribe``."""
+        with self._lock:
+            waiters = self._waiters.get(unique_id)
+            if waiters is not None:
+                waiters.discard(wakeup)
+                if not waiters:
+                    del self._waiters[unique_id]
+
+    def notify(self, unique_id):
+        """Wake up all waiters of a house."""
+        with self._lock:
+            waiters = list(self._waiters.get(unique_id, ()))
+
+        for wakeup in waiters:
+            wakeup.set()
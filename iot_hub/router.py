@@ -0,0 +1,440 @@
+"""Routes IoT hub API calls to hub shards owning the houses.
+
+Houses are spread over hubs listed in ``IOT_HUB_SHARDS`` by consistent
+hashing of ``unique_id``. Calls for one house go to its shard, listings and
+batch keepalives are split across shards and merged back, and a global alarm
+reported to one shard is fanned out to all others.
+
+Start every hub with ``IOT_HUB_SHARDS`` and its own URL in ``IOT_HUB_SHARD``,
+then run this from the ``iot_hub`` folder with the same ``IOT_HUB_SHARDS``.
+``python sharded.py`` starts all of them locally.
+"""
+import http.client
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from urllib.parse import urlencode, urlsplit
+
+from flask import Flask, Response, request
+
+from shards import HashRing, SHARDS
+
+from wire import CborMiddleware
+
+API_PATH = "/smarthouse/v1"
+
+# Seconds to wait for a shard, long-polled keepalives are held for up to 30
+SHARD_TIMEOUT_S = 60
+
+# Listing versions remembered to answer ``since`` with changes only
+VERSIONS_KEPT = 1024
+
+# Response headers passed from shards to clients
+FORWARDED_HEADERS = ("Content-Type", "ETag", "Server-Timing")
+
+# Query parameters that switch listing to paged mode
+PAGING_PARAMETERS = ("limit", "cursor", "status", "armed", "lost_since", "fields")
+
+
+class ShardClient:
+    """Calls shards over persistent HTTP connections, one per thread and shard."""
+
+    def __init__(self, timeout=SHARD_TIMEOUT_S):
+        """Initiate client without connections."""
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def request(self, shard, method, path, body=None, headers=None):
+        """Call shard, return status code, response headers and body."""
+        connections = self._local.__dict__.setdefault("connections", {})
+
+        # Connection kept idle could have been closed by the shard meanwhile
+        for reused in (shard in connections, False):
+            connection = connections.get(shard)
+            if connection is None:
+                netloc = urlsplit(shard)
+                connection = connections[shard] = http.client.HTTPConnection(
+                    netloc.hostname, netloc.port or 80, timeout=self._timeout
+                )
+
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+
+                return response.status, response.headers, response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                del connections[shard]
+                if not reused:
+                    raise
+
+
+class ListingVersions:
+    """Maps listing versions handed to clients to versions of all shards.
+
+    Versions start from current time in milliseconds, so they keep growing
+    across router restarts and an old ``since`` never maps to newer shard
+    versions. Unknown versions are answered with full listings.
+    """
+
+    def __init__(self, kept=VERSIONS_KEPT):
+        """Initiate empty version map."""
+        self._lock = threading.Lock()
+        self._kept = kept
+        self._versions = OrderedDict()
+        self._latest = None
+        self._counter = int(time() * 1000)
+
+    def issue(self, shard_versions):
+        """Get listing version of shard versions, a new one if they changed."""
+        with self._lock:
+            if shard_versions != self._latest:
+                self._counter += 1
+                self._latest = shard_versions
+                self._versions[self._counter] = shard_versions
+                if len(self._versions) > self._kept:
+                    self._versions.popitem(last=False)
+
+            return self._counter
+
+    def resolve(self, version):
+        """Get shard versions of listing version, None if not known."""
+        with self._lock:
+            return self._versions.get(version)
+
+
+app = Flask(__name__)
+app.wsgi_app = CborMiddleware(app.wsgi_app, base_path=API_PATH)
+
+RING = HashRing(SHARDS)
+CLIENT = ShardClient()
+VERSIONS = ListingVersions()
+POOL = ThreadPoolExecutor(max_workers=4 * len(RING.shards), thread_name_prefix="shard")
+
+
+def _json_response(body, status):
+    """Make JSON response."""
+    return Response(json.dumps(body), status, content_type="application/json")
+
+
+def _unavailable():
+    """Make response for shard that could not be reached."""
+    return _json_response({"message": "Hub shard unavailable"}, 502)
+
+
+def _passthrough(result):
+    """Make response from shard answer."""
+    status, headers, data = result
+
+    return Response(
+        data,
+        status,
+        [(name, headers[name]) for name in FORWARDED_HEADERS if name in headers],
+    )
+
+
+def _forward(shard):
+    """Pass current request to shard and its answer back to client."""
+    path = request.path
+    if request.query_string:
+        path += "?" + request.query_string.decode("latin-1")
+
+    headers = {
+        name: request.headers[name]
+        for name in ("Content-Type", "If-None-Match")
+        if name in request.headers
+    }
+
+    try:
+        result = CLIENT.request(
+            shard, request.method, path, request.get_data() or None, headers
+        )
+    except (http.client.HTTPException, OSError):
+        return _unavailable()
+
+    return _passthrough(result)
+
+
+def _scatter(calls):
+    """Call shards in parallel, return answers per shard, None for failures."""
+    futures = {
+        shard: POOL.submit(CLIENT.request, shard, *call)
+        for shard, call in calls.items()
+    }
+    results = {}
+
+    for shard, future in futures.items():
+        try:
+            results[shard] = future.result()
+        except (http.client.HTTPException, OSError):
+            results[shard] = None
+
+    return results
+
+
+@app.route(f"{API_PATH}/houses", methods=["POST"])
+def create():
+    """Register house with its shard."""
+    house = request.get_json(silent=True)
+    unique_id = house.get("unique_id") if isinstance(house, dict) else None
+
+    # Shard owning empty ID rejects invalid bodies like a single hub would
+    return _forward(RING.owner(str(unique_id or "")))
+
+
+@app.route(f"{API_PATH}/houses/keepalive:batch", methods=["POST"])
+def keepalive_batch():
+    """Split keepalive batch by shards and merge status codes back in order."""
+    houses = request.get_json(silent=True)
+
+    if not isinstance(houses, list) or not all(isinstance(h, dict) for h in houses):
+        return _forward(RING.shards[0])
+
+    positions = {}
+    for position, house in enumerate(houses):
+        owner = RING.owner(str(house.get("unique_id", "")))
+        positions.setdefault(owner, []).append(position)
+
+    results = _scatter(
+        {
+            shard: (
+                "POST",
+                request.path,
+                json.dumps([houses[position] for position in shard_positions]),
+                {"Content-Type": "application/json"},
+            )
+            for shard, shard_positions in positions.items()
+        }
+    )
+
+    codes = [None] * len(houses)
+    for shard, result in results.items():
+        if result is None:
+            return _unavailable()
+        if result[0] != 200:
+            return _passthrough(result)
+
+        for position, code in zip(positions[shard], json.loads(result[2])["codes"]):
+            codes[position] = code
+
+    return _json_response({"codes": codes}, 200)
+
+
+@app.route(f"{API_PATH}/houses/devices:bulk", methods=["POST"])
+def bulk_device():
+    """Run bulk device operation on shards and sum their counts."""
+    operation = request.get_json(silent=True)
+
+    if not isinstance(operation, dict):
+        return _forward(RING.shards[0])
+
+    # Listed houses go to their owners only, filters to all shards
+    if isinstance(operation.get("unique_ids"), list):
+        unique_ids = {}
+        for unique_id in operation["unique_ids"]:
+            unique_ids.setdefault(RING.owner(str(unique_id)), []).append(unique_id)
+        bodies = {
+            shard: {**operation, "unique_ids": shard_ids}
+            for shard, shard_ids in unique_ids.items()
+        }
+    else:
+        bodies = {shard: operation for shard in RING.shards}
+
+    results = _scatter(
+        {
+            shard: (
+                "POST",
+                request.path,
+                json.dumps(body),
+                {"Content-Type": "application/json"},
+            )
+            for shard, body in bodies.items()
+        }
+    )
+
+    if not results:
+        return _forward(RING.shards[0])
+
+    totals = {}
+    for result in results.values():
+        if result is None:
+            return _unavailable()
+        if result[0] != 200:
+            return _passthrough(result)
+
+        for name, value in json.loads(result[2]).items():
+            totals[name] = (
+                totals.get(name, 0) + value if isinstance(value, int) else value
+            )
+
+    return _json_response(totals, 200)
+
+
+@app.route(f"{API_PATH}/houses/<unique_id>/report_alarm", methods=["PUT"])
+def report_alarm(unique_id):
+    """Report alarm to owning shard and fan global alarm out to the others."""
+    owner = RING.owner(unique_id)
+
+    try:
+        result = CLIENT.request(owner, "PUT", request.path)
+    except (http.client.HTTPException, OSError):
+        return _unavailable()
+
+    # Owner reports fan-out only for houses in global alarm mode
+    report = json.loads(result[2]) if result[0] == 200 else {}
+    if "fanout" not in report:
+        return _passthrough(result)
+
+    results = _scatter(
+        {
+            shard: ("PUT", f"{API_PATH}/houses/{unique_id}/global_alarm")
+            for shard in RING.shards
+            if shard != owner
+        }
+    )
+
+    for result in results.values():
+        if result is not None and result[0] == 200:
+            report["fanout"] += json.loads(result[2]).get("fanout", 0)
+
+    return _json_response(report, 200)
+
+
+def _listing_calls(since_versions, etag_versions, paged_fields):
+    """Build listing calls of all shards for current request."""
+    calls = {}
+
+    for position, shard in enumerate(RING.shards):
+        query = request.args.to_dict(flat=False)
+
+        # Unknown listing version means changes since the very beginning
+        if "since" in query:
+            query["since"] = since_versions[position] if since_versions else 0
+        if paged_fields:
+            query["fields"] = paged_fields
+
+        headers = {}
+        if etag_versions:
+            headers["If-None-Match"] = f'"{etag_versions[position]}"'
+
+        calls[shard] = (
+            "GET",
+            f"{request.path}?{urlencode(query, doseq=True)}",
+            None,
+            headers,
+        )
+
+    return calls
+
+
+@app.route(f"{API_PATH}/houses", methods=["GET"])
+def read_all():
+    """List houses of all shards in the same variants as a single hub."""
+    since = request.args.get("since")
+    paged = any(name in request.args for name in PAGING_PARAMETERS)
+
+    # Invalid parameters are rejected by a shard like by a single hub
+    if since is not None and not since.isdigit():
+        return _forward(RING.shards[0])
+
+    # Merging pages needs IDs of houses, dropped again if not asked for
+    fields = request.args.get("fields")
+    add_id = bool(fields) and "unique_id" not in fields.split(",")
+    paged_fields = f"{fields},unique_id" if add_id else None
+
+    etag = request.if_none_match.as_set()
+    etag_versions = None
+    if len(etag) == 1 and next(iter(etag)).isdigit():
+        etag_versions = VERSIONS.resolve(int(next(iter(etag))))
+
+    since_versions = VERSIONS.resolve(int(since)) if since is not None else None
+    results = _scatter(_listing_calls(since_versions, etag_versions, paged_fields))
+
+    if None in results.values():
+        return _unavailable()
+
+    statuses = {result[0] for result in results.values()}
+    if statuses == {304}:
+        response = Response("", 304)
+        response.set_etag(next(iter(etag)))
+        return response
+
+    if 304 in statuses:
+        # Some shards changed, fetch all in full
+        results = _scatter(_listing_calls(since_versions, None, paged_fields))
+        if None in results.values():
+            return _unavailable()
+
+    for result in results.values():
+        if result[0] != 200:
+            return _passthrough(result)
+
+    answers = [results[shard] for shard in RING.shards]
+    version = VERSIONS.issue(
+        tuple(int(headers["ETag"].strip('"')) for _, headers, _ in answers)
+    )
+
+    if since is not None:
+        houses = [
+            house for _, _, data in answers for house in json.loads(data)["houses"]
+        ]
+        response = _json_response({"version": version, "houses": houses}, 200)
+    elif not paged:
+        # Splice JSON arrays of shards without decoding them
+        parts = [data.strip()[1:-1] for _, _, data in answers]
+        response = Response(
+            b"[" + b",".join(part for part in parts if part) + b"]",
+            200,
+            content_type="application/json",
+        )
+    else:
+        houses = sorted(
+            (house for _, _, data in answers for house in json.loads(data)["houses"]),
+            key=lambda house: house["unique_id"],
+        )
+        limit = request.args.get("limit", type=int)
+        if limit is not None:
+            houses = houses[:limit]
+
+        full_page = limit is not None and len(houses) == limit
+        next_cursor = houses[-1]["unique_id"] if full_page else None
+
+        if add_id:
+            for house in houses:
+                del house["unique_id"]
+
+        response = _json_response(
+            {"version": version, "houses": houses, "next_cursor": next_cursor}, 200
+        )
+
+    response.set_etag(str(version))
+
+    return response
+
+
+@app.route(f"{API_PATH}/houses/<unique_id>", methods=["DELETE"])
+@app.route(
+    f"{API_PATH}/houses/<unique_id>/<path:operation>",
+    methods=["GET", "PUT", "PATCH", "POST", "DELETE"],
+)
+def house_call(unique_id, operation=None):
+    """Pass call for one house to its shard."""
+    return _forward(RING.owner(unique_id))
+
+
+@app.route("/", defaults={"path": ""})
+@app.route("/<path:path>", methods=["GET", "PUT", "PATCH", "POST", "DELETE"])
+def other_call(path):
+    """Pass dashboard and anything else to the first shard."""
+    return _forward(RING.shards[0])
+
+
+if __name__ == "__main__":
+    app.run(
+        host="0.0.0.0",  # noqa: S104
+        port=int(os.environ.get("IOT_HUB_PORT", 80)),
+        threaded=True,
+    )
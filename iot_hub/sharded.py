@@ -0,0 +1,67 @@
+"""Run several hub shards and the shard router as local processes.
+
+Run from the ``iot_hub`` folder, e.g. ``python sharded.py --shards 3``, then
+point devices, dashboard or ``loadgen.py`` to the router port. Shards listen
+on following ports, each with its own store, set ``IOT_HUB_STORE`` to a
+``sqlite:///`` path containing ``{shard}`` to keep their houses on disk.
+"""
+import argparse
+import os
+import signal
+import subprocess  # noqa: S404 - starts only own hub scripts, see main
+import sys
+
+
+def main():
+    """Start shards and router, stop all of them when one exits."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="router port")
+    args = parser.parse_args()
+
+    urls = [
+        f"http://{args.host}:{args.port + 1 + shard}" for shard in range(args.shards)
+    ]
+    store = os.environ.get("IOT_HUB_STORE", "memory://")
+    processes = []
+
+    for shard, url in enumerate(urls):
+        env = dict(
+            os.environ,
+            IOT_HUB_PORT=str(args.port + 1 + shard),
+            IOT_HUB_SHARD=url,
+            IOT_HUB_SHARDS=",".join(urls),
+            IOT_HUB_STORE=store.format(shard=shard),
+        )
+        # Fixed argv of this interpreter and hub script, no shell
+        processes.append(
+            subprocess.Popen([sys.executable, "app.py"], env=env)  # noqa: S603
+        )
+
+    env = dict(os.environ, IOT_HUB_PORT=str(args.port), IOT_HUB_SHARDS=",".join(urls))
+    # Fixed argv of this interpreter and router script, no shell
+    processes.append(
+        subprocess.Popen([sys.executable, "router.py"], env=env)  # noqa: S603
+    )
+
+    # Stop on termination as on Ctrl+C, also when started in background
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    print(f"Router on http://{args.host}:{args.port}, shards {', '.join(urls)}")
+
+    try:
+        os.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
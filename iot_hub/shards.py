@@ -0,0 +1,60 @@
+"""Provides consistent hashing of houses to hub shards."""
+import hashlib
+import os
+from bisect import bisect_right
+
+# Base URLs of all hub shards, like http://10.0.0.1:80,http://10.0.0.2:80
+SHARDS = [url for url in os.environ.get("IOT_HUB_SHARDS", "").split(",") if url]
+
+# Base URL of this hub in ``SHARDS``, empty when not sharded
+SHARD = os.environ.get("IOT_HUB_SHARD", "")
+
+# Points per shard on the ring, more points spread houses more evenly
+REPLICAS = 160
+
+
+def _hash(key):
+    """Map key to a point on the ring."""
+    return int.from_bytes(
+        hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class HashRing:
+    """Assigns houses to shards by consistent hashing of ``unique_id``.
+
+    Every shard takes ``replicas`` points on a ring of 64-bit hashes and owns
+    the houses hashed between its points and the preceding ones. Adding or
+    removing a shard only moves houses next to its points, about 1/N of all.
+    """
+
+    def __init__(self, shards, replicas=REPLICAS):
+        """Place points of all shards on the ring."""
+        if not shards:
+            raise ValueError("Hash ring needs at least one shard")
+
+        self.shards = list(shards)
+        points = sorted(
+            (_hash(f"{shard}#{replica}"), shard)
+            for shard in self.shards
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def owner(self, unique_id):
+        """Get shard owning house with given ID."""
+        position = bisect_right(self._points, _hash(unique_id))
+
+        return self._owners[position % len(self._owners)]
+
+
+def owns(unique_id):
+    """Check if this hub owns house, always true when not sharded."""
+    if not SHARDS or not SHARD:
+        return True
+
+    return _RING.owner(unique_id) == SHARD
+
+
+_RING = HashRing(SHARDS) if SHARDS else None
@@ -0,0 +1,976 @@
+"""Provides storage backends for house records."""
+import fcntl
+import heapq
+import json
+import sqlite3
+import threading
+import zlib
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+
+from defaults import DEFAULT_STATE, same_json, share_defaults
+
+# Statuses of houses expected to send keepalives
+LIVE_STATUSES = ("Registered", "Active")
+
+# Fields plain keepalives change, the only ones ``touch`` writes, so a late
+# buffered keepalive cannot undo status or address set by a newer ``put``
+KEEPALIVE_FIELDS = (
+    "timestamp_keepalive",
+    "timestamp_keepalive_epoch",
+    "keepalive_deadline",
+)
+
+
+def _alarm_mode(house):
+    """Get alarm mode of a house, tolerating houses registered without state."""
+    state = house.get("state") or {}
+    alarm = state.get("alarm") or {}
+
+    return alarm.get("mode", 0)
+
+
+def _alarm_armed(house):
+    """Check if alarm of a house is armed."""
+    state = house.get("state") or {}
+    alarm = state.get("alarm") or {}
+
+    return bool(alarm.get("armed", False))
+
+
+def _alarm_triggered(house):
+    """Check if alarm of a house is going off."""
+    state = house.get("state") or {}
+    alarm = state.get("alarm") or {}
+
+    return bool(alarm.get("triggered", False))
+
+
+def _alarm_subscriber(house):
+    """Check if house takes part in global alarm fan-out."""
+    return house.get("status") != "Deleted" and _alarm_mode(house) == 2
+
+
+def _later_keepalive(house, other):
+    """Check if keepalive of house came after the one of other record."""
+    return house.get("timestamp_keepalive_epoch", 0) > other.get(
+        "timestamp_keepalive_epoch", 0
+    )
+
+
+def _keepalive_deadline(house):
+    """Get keepalive deadline of a live house, None for Lost or Deleted ones."""
+    if house.get("status") not in LIVE_STATUSES:
+        return None
+
+    return house.get("keepalive_deadline", 0)
+
+
+def _copy_record(value):
+    """Copy JSON-like house record, so the copy can be changed freely."""
+    if isinstance(value, dict):
+        return {key: _copy_record(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [_copy_record(item) for item in value]
+
+    return value
+
+
+# Shared encoder skips argument handling of ``json.dumps`` on every call
+_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+# Stands in for house state while encoding the rest of the record
+_STATE_PLACEHOLDER = "\x00"
+_ENCODED_PLACEHOLDER = b'"state":"\\u0000"'
+
+
+def _encode(value):
+    """Encode value as compact JSON bytes."""
+    return _ENCODER.encode(value).encode("utf-8")
+
+
+# Every house in default state shares its JSON too
+_DEFAULT_STATE_JSON = _encode(DEFAULT_STATE)
+
+
+def _encode_house(house, state_json):
+    """Encode house record around already encoded state."""
+    encoded = _encode({**house, "state": _STATE_PLACEHOLDER})
+
+    return encoded.replace(_ENCODED_PLACEHOLDER, b'"state":' + state_json, 1)
+
+
+# Fields copied out of the JSON record into their own SQLite columns, so they
+# can be indexed and queried without decoding every record.
+INDEXED_COLUMNS = {
+    "status": lambda house: house.get("status", ""),
+    "alarm_mode": _alarm_mode,
+    "alarm_armed": _alarm_armed,
+    "alarm_triggered": _alarm_triggered,
+    "alarm_subscriber": _alarm_subscriber,
+    "timestamp_keepalive": lambda house: house.get("timestamp_keepalive", ""),
+    "keepalive_deadline": _keepalive_deadline,
+    "version": lambda house: house.get("version", 0),
+    "timestamp_lost_epoch": lambda house: house.get("timestamp_lost_epoch", 0),
+}
+
+# Columns whose number of houses per value stores keep up to date on writes
+COUNTED_COLUMNS = ("status", "alarm_armed", "alarm_triggered")
+
+
+def _matches(house, minimum, criteria):
+    """Check house against equality criteria and lower bounds of columns."""
+    return all(
+        INDEXED_COLUMNS[column](house) == value for column, value in criteria.items()
+    ) and all(
+        INDEXED_COLUMNS[column](house) >= value for column, value in minimum.items()
+    )
+
+
+class HouseLocks:
+    """Hands out locks guarding read-modify-write of single house records.
+
+    Locks are striped by ``unique_id`` hash, so memory stays bounded for any
+    fleet size while writers of different houses rarely wait for each other.
+    Hold at most one of them at a time, two houses can share a stripe.
+
+    Without ``path`` locks order threads of one process. With ``path`` every
+    stripe also locks its own byte of that file, so processes sharing the
+    file exclude each other per stripe too, and the hash is the same in all
+    of them.
+    """
+
+    def __init__(self, stripes=1024, path=None):
+        """Initiate given number of lock stripes, optionally shared by file."""
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._file = open(path, "a") if path else None  # noqa: SIM115
+
+    def __call__(self, unique_id):
+        """Get lock guarding given house."""
+        stripe = zlib.crc32(unique_id.encode()) % len(self._locks)
+
+        if self._file is None:
+            return self._locks[stripe]
+
+        return self._file_lock(stripe)
+
+    @contextmanager
+    def _file_lock(self, stripe):
+        """Hold stripe in this process, then its byte of the shared file.
+
+        File locks are owned by the whole process, the thread lock keeps other
+        threads of it out meanwhile.
+        """
+        with self._locks[stripe]:
+            fcntl.lockf(self._file, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._file, fcntl.LOCK_UN, 1, stripe)
+
+    def close(self):
+        """Release the shared file, if any."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SortedIds:
+    """Keeps house IDs sorted, so listing can resume right after a cursor.
+
+    IDs are kept in sorted chunks of bounded size. Every change replaces the
+    chunk it touches and the chunk list instead of editing them, so iteration
+    started before the change keeps walking a consistent snapshot, while one
+    change copies only a single chunk. Changes must not run concurrently.
+    """
+
+    CHUNK_SIZE = 512
+
+    def __init__(self):
+        """Initiate empty ID list."""
+        # Chunks and their last IDs, swapped together as one snapshot
+        self._snapshot = ([], [])
+        self._count = 0
+
+    def __len__(self):
+        """Count IDs."""
+        return self._count
+
+    def __iter__(self):
+        """Iterate IDs in sorted order."""
+        return self.after()
+
+    def add(self, unique_id):
+        """Insert ID keeping the order."""
+        chunks, maxes = self._snapshot
+
+        if not chunks:
+            self._snapshot = ([[unique_id]], [unique_id])
+            self._count = 1
+            return
+
+        index = min(bisect_left(maxes, unique_id), len(chunks) - 1)
+        chunk = chunks[index]
+        position = bisect_left(chunk, unique_id)
+
+        if position < len(chunk) and chunk[position] == unique_id:
+            return
+
+        chunk = chunk[:position] + [unique_id] + chunk[position:]
+        chunks, maxes = chunks.copy(), maxes.copy()
+
+        if len(chunk) > 2 * self.CHUNK_SIZE:
+            half = self.CHUNK_SIZE
+            chunks[index] = chunk[:half]
+            chunks.insert(index + 1, chunk[half:])
+            maxes[index] = chunk[half - 1]
+            maxes.insert(index + 1, chunk[-1])
+        else:
+            chunks[index] = chunk
+            maxes[index] = chunk[-1]
+
+        self._snapshot = (chunks, maxes)
+        self._count += 1
+
+    def discard(self, unique_id):
+        """Remove ID if present."""
+        chunks, maxes = self._snapshot
+        index = bisect_left(maxes, unique_id)
+
+        if index == len(chunks):
+            return
+
+        chunk = chunks[index]
+        position = bisect_left(chunk, unique_id)
+
+        if chunk[position] != unique_id:
+            return
+
+        # Copy, as readers may still iterate the chunk of the old snapshot
+        chunk = chunk.copy()
+        del chunk[position]
+        chunks, maxes = chunks.copy(), maxes.copy()
+
+        if chunk:
+            chunks[index] = chunk
+            maxes[index] = chunk[-1]
+        else:
+            del chunks[index]
+            del maxes[index]
+
+        self._snapshot = (chunks, maxes)
+        self._count -= 1
+
+    def after(self, cursor=None):
+        """Iterate IDs greater than cursor."""
+        chunks, maxes = self._snapshot
+
+        if cursor is None:
+            index, position = 0, 0
+        else:
+            index = bisect_right(maxes, cursor)
+            position = bisect_right(chunks[index], cursor) if index < len(chunks) else 0
+
+        for chunk in chunks[index:]:
+            yield from chunk[position:]
+            position = 0
+
+
+class MemoryStore:
+    """Keeps house records in process memory, nothing survives a restart.
+
+    Columns from ``INDEXES`` are tracked in reverse indexes of sorted IDs that
+    are updated on every write, so ``select`` and ``query`` only touch houses
+    of the most selective index entry, in ``unique_id`` order. Keepalive
+    deadlines of live houses are kept in one-second buckets ordered by a
+    min-heap, so ``expired`` only touches houses that actually expired.
+
+    Every ``put`` stamps the record with the next store version and moves it
+    to the end of the change log, so ``changed_since`` only walks houses that
+    changed after the given version. Keepalive ``touch`` is versioned the same
+    way, so listings with ``since`` and ``ETag`` show fresh keepalive times.
+
+    Stored records are never changed in place: writes swap in new records
+    under a short writer lock, so reads take no lock and always see whole
+    records. ``get`` returns a private copy to modify and ``put`` back,
+    while listing methods return shared records that must not be changed.
+    Read-modify-write of a house is guarded by ``lock``.
+
+    JSON of records and their states is cached next to them. A fragment
+    stays valid as long as the store holds the very record or state object
+    it was encoded from, so it is re-encoded only after a write. ``put``
+    keeps the previous state object if the state did not change.
+
+    States share devices left at defaults with ``DEFAULT_STATE``, and houses
+    fully in default state share the template and its JSON, so idle houses
+    cost little more than their top-level fields.
+    """
+
+    INDEXES = (
+        "status",
+        "alarm_mode",
+        "alarm_armed",
+        "alarm_triggered",
+        "alarm_subscriber",
+    )
+
+    def __init__(self, seed=None):
+        """Initiate empty store, optionally filled with seed records."""
+        self._houses = {}
+        self._sorted_ids = SortedIds()
+        self._index_keys = {}
+        self._indexes = {column: {} for column in self.INDEXES}
+        self._deadline_buckets = {}
+        self._deadline_heap = []
+        self._deadline_of = {}
+        self._version = 0
+        self._change_log = {}
+        self._write_lock = threading.Lock()
+        self._house_locks = HouseLocks()
+        self._house_fragments = {}
+        self._state_fragments = {}
+
+        for house in (seed or {}).values():
+            self.put(house)
+
+    def _reindex(self, house):
+        """Move house between reverse index entries if indexed columns changed."""
+        unique_id = house["unique_id"]
+        self._schedule(unique_id, _keepalive_deadline(house))
+
+        old_keys = self._index_keys.get(unique_id)
+        new_keys = tuple(INDEXED_COLUMNS[column](house) for column in self.INDEXES)
+
+        if old_keys == new_keys:
+            return
+
+        for position, column in enumerate(self.INDEXES):
+            index = self._indexes[column]
+            new_key = new_keys[position]
+
+            if old_keys is not None:
+                old_key = old_keys[position]
+                if old_key == new_key:
+                    continue
+
+                index[old_key].discard(unique_id)
+                if not index[old_key]:
+                    del index[old_key]
+
+            index.setdefault(new_key, SortedIds()).add(unique_id)
+
+        self._index_keys[unique_id] = new_keys
+
+    def _schedule(self, unique_id, deadline):
+        """Move house to the bucket of its keepalive deadline."""
+        bucket = None if deadline is None else int(deadline)
+        old_bucket = self._deadline_of.get(unique_id)
+
+        if bucket == old_bucket:
+            return
+
+        if old_bucket is not None:
+            self._deadline_buckets[old_bucket].discard(unique_id)
+            del self._deadline_of[unique_id]
+
+        if bucket is not None:
+            if bucket not in self._deadline_buckets:
+                self._deadline_buckets[bucket] = set()
+                heapq.heappush(self._deadline_heap, bucket)
+
+            self._deadline_buckets[bucket].add(unique_id)
+            self._deadline_of[unique_id] = bucket
+
+    def __contains__(self, unique_id):
+        """Check if house record exists."""
+        return unique_id in self._houses
+
+    def __len__(self):
+        """Count house records."""
+        return len(self._houses)
+
+    def get(self, unique_id):
+        """Get copy of house record or None if not found."""
+        house = self._houses.get(unique_id)
+
+        return _copy_record(house) if house is not None else None
+
+    def lock(self, unique_id):
+        """Get lock to hold while reading, changing and writing back a house."""
+        return self._house_locks(unique_id)
+
+    @property
+    def version(self):
+        """Get version of the latest change in the store."""
+        return self._version
+
+    def put(self, house):
+        """Insert or replace house record, stamping it with next version."""
+        unique_id = house["unique_id"]
+
+        with self._write_lock:
+            version = self._version + 1
+            house["version"] = version
+            stored = _copy_record(house)
+            if "state" in stored:
+                stored["state"] = share_defaults(stored["state"])
+
+            old = self._houses.get(unique_id)
+            if old is None:
+                self._sorted_ids.add(unique_id)
+            elif same_json(old.get("state"), stored.get("state")):
+                # Same state object keeps its cached JSON valid, so values
+                # equal in Python but not in JSON like True and 1 must differ
+                stored["state"] = old.get("state")
+
+            self._houses[unique_id] = stored
+            self._reindex(stored)
+
+            self._change_log.pop(unique_id, None)
+            self._change_log[unique_id] = version
+
+            # Publish version last, readers of it already see the record
+            self._version = version
+
+    def touch(self, unique_id, fields):
+        """Update ``KEEPALIVE_FIELDS`` of a house record, stamping it with next version.
+
+        Unlike ``put`` the state object and the index keys are kept as they are.
+        """
+        fields = {key: fields[key] for key in KEEPALIVE_FIELDS if key in fields}
+
+        with self._write_lock:
+            version = self._version + 1
+            house = {**self._houses[unique_id], **fields, "version": version}
+            self._houses[unique_id] = house
+            self._reindex(house)
+
+            self._change_log.pop(unique_id, None)
+            self._change_log[unique_id] = version
+            self._version = version
+
+    def counts(self):
+        """Count houses per value of ``COUNTED_COLUMNS`` from index sizes."""
+        return {
+            column: {key: len(ids) for key, ids in list(self._indexes[column].items())}
+            for column in COUNTED_COLUMNS
+        }
+
+    def _candidates(self, criteria):
+        """Pick the smallest sorted ID list that covers all matching houses."""
+        indexed = [
+            self._indexes[column].get(value, SortedIds())
+            for column, value in criteria.items()
+            if column in self._indexes
+        ]
+
+        return min(indexed, key=len) if indexed else self._sorted_ids
+
+    def select(self, **criteria):
+        """List IDs of houses whose indexed columns match all criteria."""
+        return [
+            unique_id
+            for unique_id in self._candidates(criteria)
+            if _matches(self._houses[unique_id], {}, criteria)
+        ]
+
+    def query(self, cursor=None, limit=None, minimum=None, **criteria):
+        """List house records matching criteria in ``unique_id`` order.
+
+        Listing starts after ``cursor`` and stops at ``limit`` records.
+        ``minimum`` maps columns to inclusive lower bounds.
+        """
+        page = []
+
+        for unique_id in self._candidates(criteria).after(cursor):
+            house = self._houses[unique_id]
+            if _matches(house, minimum or {}, criteria):
+                page.append(house)
+                if limit is not None and len(page) == limit:
+                    break
+
+        return page
+
+    def changed_since(self, version):
+        """List house records changed after given version, oldest change first."""
+        if version <= 0:
+            return self.values()
+
+        changed = []
+
+        # Writers reorder the log, the walk only covers changed houses
+        with self._write_lock:
+            for unique_id, changed_version in reversed(self._change_log.items()):
+                if changed_version <= version:
+                    break
+                changed.append(self._houses[unique_id])
+
+        changed.reverse()
+
+        return changed
+
+    def expired(self, now):
+        """List IDs of live houses with keepalive deadline before ``now``."""
+        expired = []
+
+        with self._write_lock:
+            # Bucket N holds deadlines in [N, N + 1), so it is due once N + 1 <= now
+            while self._deadline_heap and self._deadline_heap[0] + 1 <= now:
+                bucket = heapq.heappop(self._deadline_heap)
+                for unique_id in self._deadline_buckets.pop(bucket):
+                    del self._deadline_of[unique_id]
+                    expired.append(unique_id)
+
+        return expired
+
+    def values(self):
+        """List all house records."""
+        return list(self._houses.values())
+
+    def items(self):
+        """List all (unique_id, house record) pairs."""
+        return list(self._houses.items())
+
+    def _state_json(self, house):
+        """Get cached JSON of house state, encoding it if state was replaced."""
+        state = house.get("state")
+        if state is DEFAULT_STATE:
+            self._state_fragments.pop(house["unique_id"], None)
+            return _DEFAULT_STATE_JSON
+
+        cached = self._state_fragments.get(house["unique_id"])
+
+        if cached is None or cached[0] is not state:
+            cached = (state, _encode(state))
+            self._state_fragments[house["unique_id"]] = cached
+
+        return cached[1]
+
+    def state_json(self, unique_id):
+        """Get JSON bytes of house state or None if house is not found."""
+        house = self._houses.get(unique_id)
+
+        return self._state_json(house) if house is not None else None
+
+    def house_json(self, house):
+        """Get JSON bytes of a house record returned by a listing method."""
+        cached = self._house_fragments.get(house["unique_id"])
+
+        if cached is None or cached[0] is not house:
+            cached = (house, _encode_house(house, self._state_json(house)))
+            self._house_fragments[house["unique_id"]] = cached
+
+        return cached[1]
+
+    def close(self):
+        """Release resources held by the store."""
+
+
+class SqliteStore:
+    """Keeps house records in SQLite database running in WAL mode.
+
+    Every record is stored as JSON next to a few indexed columns from
+    ``INDEXED_COLUMNS``. Keepalive updates are buffered in memory and written
+    by a background thread in one transaction every ``commit_interval``
+    seconds, so a fleet of heartbeats costs one commit instead of one per house.
+    All houses of such a commit are stamped with one new version, so
+    keepalive times show up in ``changed_since`` and ``version`` once committed.
+    Triggers keep house counts of ``COUNTED_COLUMNS`` in a small table, so
+    counting does not scan houses.
+
+    Every thread reads through its own connection, so reads see a consistent
+    WAL snapshot without locking. Locks from ``lock`` are striped per house
+    over ``<path>.locks`` next to the database, so read-modify-write of a
+    house is atomic across all processes sharing the database file, while
+    writers of other houses go on. Only the write itself takes the database
+    write lock, as SQLite has one writer at a time. Threads of one process
+    queue for it in process rather than polling the file lock.
+    """
+
+    def __init__(self, path, seed=None, commit_interval=0.5, commit_batch=5000):
+        """Open database, create schema and start keepalive committer."""
+        self._path = path
+        self._local = threading.local()
+
+        self._pending = {}
+        self._committing = {}
+        self._pending_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._commit_interval = commit_interval
+        self._commit_batch = commit_batch
+        self._commit_wakeup = threading.Event()
+        self._closed = False
+        self._writer = threading.Lock()
+        self._house_locks = HouseLocks(path=f"{path}.locks")
+
+        self._create_schema()
+
+        if seed and len(self) == 0:
+            for house in seed.values():
+                self.put(house)
+
+        self._committer = threading.Thread(
+            target=self._commit_loop, name="store-committer", daemon=True
+        )
+        self._committer.start()
+
+    def _connection(self):
+        """Get SQLite connection owned by current thread."""
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self._path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+
+        return connection
+
+    def _create_schema(self):
+        """Create houses table and indexes, adding columns missing in old files."""
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS houses ("
+            "unique_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+
+        existing = {row[1] for row in connection.execute("PRAGMA table_info(houses)")}
+        missing = [column for column in INDEXED_COLUMNS if column not in existing]
+
+        for column in missing:
+            connection.execute(f"ALTER TABLE houses ADD COLUMN {column}")
+
+        for column in INDEXED_COLUMNS:
+            # Index by column and ID, so filtered listing can page by cursor
+            connection.execute(f"DROP INDEX IF EXISTS houses_{column}")
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS houses_by_{column} "
+                f"ON houses({column}, unique_id)"
+            )
+
+        if missing:
+            # Fill new columns of records written by older versions
+            connection.execute("BEGIN IMMEDIATE")
+            for (data,) in connection.execute("SELECT data FROM houses").fetchall():
+                self._write(connection, json.loads(data))
+            connection.execute("COMMIT")
+
+        self._create_counts(connection, recount=bool(missing))
+
+    def _create_counts(self, connection, recount=False):
+        """Create house counts kept up to date by triggers on every write."""
+        connection.execute("BEGIN IMMEDIATE")
+
+        exists = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'house_counts'"
+        ).fetchone()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS house_counts ("
+            "name TEXT, value, count INTEGER NOT NULL, PRIMARY KEY (name, value))"
+        )
+
+        # Column names come from COUNTED_COLUMNS, never from requests
+        for column in COUNTED_COLUMNS:
+            increment = (
+                "INSERT INTO house_counts (name, value, count) "  # noqa: S608
+                f"VALUES ('{column}', NEW.{column}, 1) "
+                "ON CONFLICT (name, value) DO UPDATE SET count = count + 1;"
+            )
+            decrement = (
+                "UPDATE house_counts SET count = count - 1 "  # noqa: S608
+                f"WHERE name = '{column}' AND value IS OLD.{column};"
+            )
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS houses_count_{column}_insert "
+                f"AFTER INSERT ON houses BEGIN {increment} END"
+            )
+            # Keepalive commits rewrite records, only changed values count
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS houses_count_{column}_update "
+                f"AFTER UPDATE OF {column} ON houses "
+                f"WHEN OLD.{column} IS NOT NEW.{column} "
+                f"BEGIN {decrement} {increment} END"
+            )
+            connection.execute(
+                f"CREATE TRIGGER IF NOT EXISTS houses_count_{column}_delete "
+                f"AFTER DELETE ON houses BEGIN {decrement} END"
+            )
+
+        if not exists or recount:
+            connection.execute("DELETE FROM house_counts")
+            for column in COUNTED_COLUMNS:
+                connection.execute(
+                    "INSERT INTO house_counts (name, value, count) "  # noqa: S608
+                    f"SELECT '{column}', {column}, COUNT(*) FROM houses "
+                    f"GROUP BY {column}"
+                )
+
+        connection.execute("COMMIT")
+
+    def _write(self, connection, house):
+        """Write house record with its indexed columns."""
+        columns = ", ".join(INDEXED_COLUMNS)
+        placeholders = ", ".join("?" for _ in INDEXED_COLUMNS)
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in INDEXED_COLUMNS
+        )
+
+        # Upsert keeps rowid of existing records, so listing order stays stable.
+        # Column names come from INDEXED_COLUMNS, values are bound parameters
+        connection.execute(
+            f"INSERT INTO houses (unique_id, data, {columns}) "  # noqa: S608
+            f"VALUES (?, ?, {placeholders}) "
+            f"ON CONFLICT (unique_id) DO UPDATE SET data = excluded.data, {updates}",
+            (
+                house["unique_id"],
+                json.dumps(house),
+                *(column(house) for column in INDEXED_COLUMNS.values()),
+            ),
+        )
+
+    def _read(self, unique_id):
+        """Read house record from database without pending keepalive updates."""
+        row = (
+            self._connection()
+            .execute("SELECT data FROM houses WHERE unique_id = ?", (unique_id,))
+            .fetchone()
+        )
+
+        return json.loads(row[0]) if row else None
+
+    def _with_pending(self, house):
+        """Apply keepalive update waiting for commit to house record."""
+        for pending in (self._committing, self._pending):
+            fields = pending.get(house["unique_id"])
+            if fields:
+                house.update(fields)
+
+        return house
+
+    def __contains__(self, unique_id):
+        """Check if house record exists."""
+        row = (
+            self._connection()
+            .execute("SELECT 1 FROM houses WHERE unique_id = ?", (unique_id,))
+            .fetchone()
+        )
+
+        return row is not None
+
+    def __len__(self):
+        """Count house records."""
+        return self._connection().execute("SELECT COUNT(*) FROM houses").fetchone()[0]
+
+    def get(self, unique_id):
+        """Get house record or None if not found."""
+        house = self._read(unique_id)
+
+        return self._with_pending(house) if house else None
+
+    @contextmanager
+    def _transaction(self):
+        """Hold write transaction of current thread.
+
+        Changes are committed when the block ends and rolled back if it raises.
+        """
+        connection = self._connection()
+
+        with self._writer:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            finally:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+
+    def lock(self, unique_id):
+        """Get lock to hold while reading, changing and writing back a house.
+
+        The lock is shared with all processes opening the same database file.
+        """
+        return self._house_locks(unique_id)
+
+    @property
+    def version(self):
+        """Get version of the latest change in the store."""
+        return (
+            self._connection()
+            .execute("SELECT COALESCE(MAX(version), 0) FROM houses")
+            .fetchone()[0]
+        )
+
+    def put(self, house):
+        """Insert or replace house record, stamping it with next version.
+
+        Keepalive updates of the house buffered so far are dropped, the record
+        written already carries them or is newer. Newer keepalive fields
+        committed meanwhile by another process are kept.
+        """
+        unique_id = house["unique_id"]
+
+        with self._transaction() as connection:
+            with self._pending_lock:
+                self._pending.pop(unique_id, None)
+                self._committing.pop(unique_id, None)
+
+            stored = self._read(unique_id)
+            if stored is not None and _later_keepalive(stored, house):
+                house.update(
+                    {key: stored[key] for key in KEEPALIVE_FIELDS if key in stored}
+                )
+
+            house["version"] = self.version + 1
+            self._write(connection, house)
+
+    def touch(self, unique_id, fields):
+        """Queue ``KEEPALIVE_FIELDS`` of a house record for group commit."""
+        fields = {key: fields[key] for key in KEEPALIVE_FIELDS if key in fields}
+
+        with self._pending_lock:
+            # Replace rather than update, readers apply pending fields unlocked
+            self._pending[unique_id] = {**self._pending.get(unique_id, {}), **fields}
+            pending_count = len(self._pending)
+
+        if pending_count >= self._commit_batch:
+            self._commit_wakeup.set()
+
+    def counts(self):
+        """Count houses per value of ``COUNTED_COLUMNS`` kept by triggers."""
+        counts = {column: {} for column in COUNTED_COLUMNS}
+
+        for name, value, count in self._connection().execute(
+            "SELECT name, value, count FROM house_counts WHERE count > 0"
+        ):
+            # Flags come back from SQLite as integers
+            counts[name][bool(value) if name.startswith("alarm_") else value] = count
+
+        return counts
+
+    def select(self, **criteria):
+        """List IDs of houses whose indexed columns match all criteria."""
+        where = " AND ".join(f"{column} = ?" for column in criteria)
+        rows = self._connection().execute(
+            f"SELECT unique_id FROM houses WHERE {where}",  # noqa: S608
+            tuple(criteria.values()),
+        )
+
+        return [unique_id for (unique_id,) in rows]
+
+    def query(self, cursor=None, limit=None, minimum=None, **criteria):
+        """List house records matching criteria in ``unique_id`` order.
+
+        Listing starts after ``cursor`` and stops at ``limit`` records.
+        ``minimum`` maps columns to inclusive lower bounds.
+        """
+        minimum = minimum or {}
+        conditions = [f"{column} = ?" for column in criteria]
+        conditions += [f"{column} >= ?" for column in minimum]
+        parameters = [*criteria.values(), *minimum.values()]
+
+        if cursor is not None:
+            conditions.append("unique_id > ?")
+            parameters.append(cursor)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection().execute(
+            f"SELECT data FROM houses {where} ORDER BY unique_id LIMIT ?",  # noqa: S608
+            (*parameters, -1 if limit is None else limit),
+        )
+
+        return [self._with_pending(json.loads(data)) for (data,) in rows]
+
+    def changed_since(self, version):
+        """List house records changed after given version, oldest change first."""
+        if version <= 0:
+            return self.values()
+
+        rows = self._connection().execute(
+            "SELECT data FROM houses WHERE version > ? ORDER BY version", (version,)
+        )
+
+        return [self._with_pending(json.loads(data)) for (data,) in rows]
+
+    def expired(self, now):
+        """List IDs of live houses with keepalive deadline before ``now``."""
+        rows = self._connection().execute(
+            "SELECT unique_id FROM houses WHERE keepalive_deadline < ?", (now,)
+        )
+
+        return [unique_id for (unique_id,) in rows]
+
+    def values(self):
+        """List all house records."""
+        rows = self._connection().execute("SELECT data FROM houses ORDER BY rowid")
+
+        return [self._with_pending(json.loads(data)) for (data,) in rows]
+
+    def items(self):
+        """List all (unique_id, house record) pairs."""
+        return [(house["unique_id"], house) for house in self.values()]
+
+    def state_json(self, unique_id):
+        """Get JSON bytes of house state or None if house is not found."""
+        house = self._read(unique_id)
+
+        return _encode(house.get("state")) if house is not None else None
+
+    def house_json(self, house):
+        """Get JSON bytes of a house record returned by a listing method.
+
+        Records are decoded afresh on every read, so nothing is cached.
+        """
+        return _encode_house(house, _encode(house.get("state")))
+
+    def commit_pending(self):
+        """Write all buffered keepalive updates in a single transaction.
+
+        Calls are serialized, as updates being committed are kept in one
+        attribute for readers until the commit is visible.
+        """
+        with self._commit_lock:
+            with self._pending_lock:
+                self._committing, self._pending = self._pending, {}
+
+            if not self._committing:
+                return
+
+            with self._transaction() as connection:
+                version = self.version + 1
+                for unique_id, fields in self._committing.items():
+                    house = self._read(unique_id)
+                    if house is not None and not _later_keepalive(house, fields):
+                        house.update(fields, version=version)
+                        self._write(connection, house)
+
+            self._committing = {}
+
+    def _commit_loop(self):
+        """Commit buffered keepalive updates until store is closed."""
+        while not self._closed:
+            self._commit_wakeup.wait(self._commit_interval)
+            self._commit_wakeup.clear()
+            self.commit_pending()
+
+    def close(self):
+        """Commit buffered updates and stop committer thread."""
+        self._closed = True
+        self._commit_wakeup.set()
+        self._committer.join()
+        self.commit_pending()
+        self._house_locks.close()
+
+
+def make_store(url, seed=None):
+    """Create store from URL like ``memory://`` or ``sqlite:///path/to/houses.db``."""
+    scheme, _, path = url.partition("://")
+
+    if scheme == "sqlite":
+        return SqliteStore(path, seed=seed)
+
+    if scheme == "memory":
+        return MemoryStore(seed=seed)
+
+    raise ValueError(f"Unsupported store URL: {url}")
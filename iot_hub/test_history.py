@@ -0,0 +1,31 @@
+"""Tests of per-house state change history."""
+from history import HouseHistory
+
+
+def test_removed_field_is_recorded_once():
+    """Field missing from later states is one change, not one per append."""
+    history = HouseHistory(64)
+    history.append(1, {"led.active": True, "wall_msg": "Hi"})
+    history.append(2, {"led.active": True})
+    history.append(3, {"led.active": False})
+    history.append(4, {"led.active": False})
+
+    result = history.query(0, 10)
+
+    assert result["changes"] == [[1, 1], [2, 1], [3, 1]]
+    assert result["series"]["wall_msg"] == [[1, "Hi"], [2, None]]
+    assert result["series"]["led.active"] == [[1, True], [3, False]]
+
+
+def test_removed_field_can_come_back():
+    """Field present again after removal is recorded as a change."""
+    history = HouseHistory(64)
+    history.append(1, {"wall_msg": "Hi"})
+    history.append(2, {})
+    history.append(3, {"wall_msg": "Bye"})
+
+    assert history.query(0, 10)["series"]["wall_msg"] == [
+        [1, "Hi"],
+        [2, None],
+        [3, "Bye"],
+    ]
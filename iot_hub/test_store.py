@@ -0,0 +1,75 @@
+"""Tests of buffered keepalive updates in SQLite house store."""
+import pytest
+
+from store import SqliteStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Open SQLite store with one Active house and committer kept idle."""
+    store = SqliteStore(str(tmp_path / "houses.db"), commit_interval=3600)
+    store.put(
+        {
+            "unique_id": "1337CAFEC0DE",
+            "ip_address": "10.0.0.1",
+            "status": "Active",
+            "timestamp_keepalive": "2023-07-13 00:00:00",
+            "timestamp_keepalive_epoch": 1689206400,
+            "keepalive_deadline": 1689206460,
+            "timestamp_deleted": "",
+        }
+    )
+    yield store
+    store.close()
+
+
+def keepalive(store, ip_address="10.0.0.1"):
+    """Touch house the way a plain keepalive does."""
+    store.touch(
+        "1337CAFEC0DE",
+        {
+            "ip_address": ip_address,
+            "status": "Active",
+            "timestamp_keepalive": "2023-07-13 00:00:10",
+            "timestamp_keepalive_epoch": 1689206410,
+            "keepalive_deadline": 1689206470,
+        },
+    )
+
+
+def test_delete_after_keepalive_stays_deleted(store):
+    """Delete wins over keepalive buffered before it, in reads and commit."""
+    keepalive(store)
+
+    house = store.get("1337CAFEC0DE")
+    house.update({"status": "Deleted", "timestamp_deleted": "2023-07-13 00:00:11"})
+    store.put(house)
+
+    assert store.get("1337CAFEC0DE")["status"] == "Deleted"
+    store.commit_pending()
+    assert store.get("1337CAFEC0DE")["status"] == "Deleted"
+    assert store.values()[0]["timestamp_deleted"] == "2023-07-13 00:00:11"
+
+
+def test_ip_change_after_keepalive_is_kept(store):
+    """Address change wins over keepalive buffered before it."""
+    keepalive(store)
+
+    house = store.get("1337CAFEC0DE")
+    house["ip_address"] = "10.0.0.2"
+    store.put(house)
+    store.commit_pending()
+
+    house = store.get("1337CAFEC0DE")
+    assert house["ip_address"] == "10.0.0.2"
+    assert house["timestamp_keepalive_epoch"] == 1689206410
+
+
+def test_keepalive_only_writes_keepalive_fields(store):
+    """Buffered keepalive leaves address to writes of whole records."""
+    keepalive(store, ip_address="10.0.0.9")
+    store.commit_pending()
+
+    house = store.get("1337CAFEC0DE")
+    assert house["ip_address"] == "10.0.0.1"
+    assert house["keepalive_deadline"] == 1689206470
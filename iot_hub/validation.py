@@ -0,0 +1,250 @@
+"""Provides cached and instrumented OpenAPI request validators.
+
+Connexion builds a fresh JSON schema validator for every request parameter
+on every request. Validators here compile parameter schemas once at startup,
+record validation time per operationId and can take a lean path for bodies
+of simple object schemas, like the keepalive one.
+"""
+import copy
+import functools
+import os
+import re
+import threading
+import time
+
+from connexion.apis.flask_utils import flaskify_endpoint
+from connexion.decorators.validation import (
+    ParameterValidator,
+    RequestBodyValidator,
+    TypeValidationError,
+    coerce_type,
+)
+from connexion.utils import is_null, is_nullable
+
+from flask import g, request as flask_request
+
+from jsonschema import Draft4Validator, ValidationError, draft4_format_checker
+
+# Operations whose bodies are checked by lean path first, empty to disable
+LEAN_OPERATIONS = set(
+    filter(
+        None, os.environ.get("IOT_HUB_LEAN_VALIDATION", "houses.keepalive").split(",")
+    )
+)
+
+# Add ``Server-Timing`` header with validation time to responses
+SERVER_TIMING = os.environ.get("IOT_HUB_SERVER_TIMING", "") not in ("", "0")
+
+# Keywords lean path understands, anything else makes schema not lean, while
+# components are only attached by connexion to resolve references
+_LEAN_OBJECT_KEYWORDS = {
+    "type",
+    "required",
+    "properties",
+    "x-body-name",
+    "components",
+}
+_LEAN_STRING_KEYWORDS = {"type", "pattern"}
+
+# Flask endpoint names of operations mapped to their operationId
+_OPERATION_IDS = {}
+
+
+def register_operations(specification):
+    """Remember operationIds of API specification for instrumentation."""
+    for methods in specification["paths"].values():
+        for operation in methods.values():
+            if isinstance(operation, dict) and "operationId" in operation:
+                operation_id = operation["operationId"]
+                _OPERATION_IDS[flaskify_endpoint(operation_id)] = operation_id
+
+
+def current_operation():
+    """Get operationId of request being served, None outside of API."""
+    endpoint = (flask_request.endpoint or "").rsplit(".", 1)[-1]
+
+    return _OPERATION_IDS.get(endpoint)
+
+
+class ValidationStats:
+    """Accumulates request validation time per operationId."""
+
+    def __init__(self):
+        """Initiate empty statistics."""
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, operation_id, seconds):
+        """Add validation time of one validator run."""
+        with self._lock:
+            stats = self._stats.setdefault(operation_id, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def snapshot(self):
+        """Get run count, total and max seconds per operationId."""
+        with self._lock:
+            return {
+                operation_id: {"count": count, "total_s": total, "max_s": longest}
+                for operation_id, (count, total, longest) in self._stats.items()
+            }
+
+
+STATS = ValidationStats()
+
+
+class _TimedValidator:
+    """Records time spent by validator, leaving out the wrapped handler."""
+
+    def __call__(self, function):
+        """Wrap function with validation and its timing."""
+        handled = threading.local()
+
+        def handler(request):
+            handled.at = time.perf_counter()
+            return function(request)
+
+        validate = super().__call__(handler)
+
+        @functools.wraps(function)
+        def wrapper(request):
+            handled.at = None
+            started = time.perf_counter()
+            try:
+                return validate(request)
+            finally:
+                # Rejected requests never reach the handler
+                seconds = (handled.at or time.perf_counter()) - started
+                STATS.record(current_operation(), seconds)
+                g.validation_s = g.get("validation_s", 0.0) + seconds
+
+        return wrapper
+
+
+class CachedParameterValidator(_TimedValidator, ParameterValidator):
+    """Validates parameters with schema validators compiled once."""
+
+    def __init__(self, parameters, api, strict_validation=False):
+        """Compile validators of all parameters."""
+        super().__init__(parameters, api, strict_validation=strict_validation)
+
+        self._validators = {}
+        for params in self.parameters.values():
+            for param in params:
+                schema = copy.deepcopy(param)
+                schema = schema.get("schema", schema)
+                schema.pop("required", None)
+                self._validators[id(param)] = Draft4Validator(
+                    schema, format_checker=draft4_format_checker
+                )
+
+    def validate_parameter(self, parameter_type, value, param, param_name=None):
+        """Validate parameter value, return error message if invalid."""
+        validator = self._validators.get(id(param))
+
+        # Missing values and uploaded files keep stock handling
+        if value is None or validator is None or parameter_type == "formdata":
+            return ParameterValidator.validate_parameter(
+                parameter_type, value, param, param_name
+            )
+
+        if is_nullable(param) and is_null(value):
+            return None
+
+        try:
+            converted_value = coerce_type(param, value, parameter_type, param_name)
+        except TypeValidationError as e:
+            return str(e)
+
+        try:
+            validator.validate(converted_value)
+        except ValidationError as e:
+            return str(e)
+
+        return None
+
+
+def compile_lean_check(schema):
+    """Build fast check of object schema with string properties.
+
+    Returns function telling if data surely matches schema, or None if schema
+    uses keywords beyond ``type``, ``required`` and ``properties`` with string
+    ``type`` and ``pattern``. Other properties are only accepted if absent.
+    Anything the check does not accept still has to go through full schema
+    validation, which also produces the error message.
+    """
+    if schema.get("type") != "object" or not set(schema) <= _LEAN_OBJECT_KEYWORDS:
+        return None
+
+    required = tuple(schema.get("required", ()))
+    strings = []
+    complex_names = []
+
+    for name, prop in schema.get("properties", {}).items():
+        if prop.get("type") == "string" and set(prop) <= _LEAN_STRING_KEYWORDS:
+            # Same search as jsonschema does, so anchors behave the same
+            pattern = re.compile(prop["pattern"]) if "pattern" in prop else None
+            strings.append((name, pattern))
+        else:
+            complex_names.append(name)
+
+    def check(data):
+        if type(data) is not dict:
+            return False
+
+        for name in required:
+            if name not in data:
+                return False
+
+        for name, pattern in strings:
+            if name in data:
+                value = data[name]
+                if type(value) is not str:
+                    return False
+                if pattern is not None and pattern.search(value) is None:
+                    return False
+
+        for name in complex_names:
+            if name in data:
+                return False
+
+        return True
+
+    return check
+
+
+class LeanBodyValidator(_TimedValidator, RequestBodyValidator):
+    """Validates request body, trying lean check of ``LEAN_OPERATIONS`` first."""
+
+    def __init__(self, schema, consumes, api, is_null_value_valid=False, **kwargs):
+        """Compile lean check of body schema if it is simple enough."""
+        super().__init__(schema, consumes, api, is_null_value_valid, **kwargs)
+
+        self._lean_check = compile_lean_check(schema)
+
+    def validate_schema(self, data, url):
+        """Validate body, with full schema validation unless lean check passes."""
+        if (
+            self._lean_check is not None
+            and current_operation() in LEAN_OPERATIONS
+            and self._lean_check(data)
+        ):
+            return None
+
+        return super().validate_schema(data, url)
+
+
+VALIDATOR_MAP = {
+    "parameter": CachedParameterValidator,
+    "body": LeanBodyValidator,
+}
+
+
+def add_server_timing(response):
+    """Report validation time of request in ``Server-Timing`` header."""
+    validation_s = g.get("validation_s")
+    if validation_s is not None:
+        response.headers["Server-Timing"] = f"validate;dur={validation_s * 1000:.3f}"
+
+    return response
@@ -0,0 +1,95 @@
+"""Provides CBOR wire format negotiation for device endpoints."""
+import json
+from io import BytesIO
+
+import cbor2
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+# CBOR media types of requests and the JSON ones handlers are written for
+REQUEST_TYPES = {
+    "application/cbor": "application/json",
+    "application/merge-patch+cbor": "application/merge-patch+json",
+}
+
+# Paths of endpoints called by house firmware, relative to API base path
+DEVICE_PATHS = ("/houses", "/keepalive", "/state")
+
+
+class CborMiddleware:
+    """Translates CBOR requests and responses of device endpoints from JSON.
+
+    Requests with CBOR ``Content-Type`` are decoded before the API sees them,
+    so validation and handlers stay JSON-only. Responses are encoded to CBOR
+    if the client prefers ``application/cbor`` in ``Accept``. Everything else,
+    like the dashboard, keeps talking JSON.
+    """
+
+    def __init__(self, wsgi_app, base_path="/smarthouse/v1"):
+        """Wrap WSGI app serving API under given base path."""
+        self._wsgi_app = wsgi_app
+        self._base_path = base_path
+
+    def _is_device_path(self, path):
+        """Check if path belongs to register, keepalive or state endpoint."""
+        return path.startswith(self._base_path) and path.endswith(DEVICE_PATHS)
+
+    def __call__(self, environ, start_response):
+        """Serve request, translating CBOR on device endpoints."""
+        if not self._is_device_path(environ.get("PATH_INFO", "")):
+            return self._wsgi_app(environ, start_response)
+
+        content_type = environ.get("CONTENT_TYPE", "").split(";")[0].strip()
+
+        if content_type in REQUEST_TYPES:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            try:
+                body = cbor2.loads(environ["wsgi.input"].read(length))
+                # Byte strings, tags or undefined have no JSON form
+                body = json.dumps(body).encode("utf-8")
+            except (cbor2.CBORDecodeError, ValueError, TypeError):
+                start_response("400 BAD REQUEST", [("Content-Type", "text/plain")])
+                return [b"Malformed CBOR body"]
+
+            environ["CONTENT_TYPE"] = REQUEST_TYPES[content_type]
+            environ["CONTENT_LENGTH"] = str(len(body))
+            environ["wsgi.input"] = BytesIO(body)
+
+        accept = parse_accept_header(environ.get("HTTP_ACCEPT"), MIMEAccept)
+        if accept.best_match(("application/json", "application/cbor")) != (
+            "application/cbor"
+        ):
+            return self._wsgi_app(environ, start_response)
+
+        captured = []
+
+        def capture_response(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+
+        chunks = self._wsgi_app(environ, capture_response)
+        try:
+            body = b"".join(chunks)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+        status, headers, exc_info = captured
+        headers = headers + [("Vary", "Accept")]
+        mimetype = dict(headers).get("Content-Type", "")
+
+        if body and "json" in mimetype:
+            body = cbor2.dumps(json.loads(body))
+            headers = [
+                (name, value)
+                for name, value in headers
+                if name.lower() not in ("content-type", "content-length")
+            ]
+            headers += [
+                ("Content-Type", "application/cbor"),
+                ("Content-Length", str(len(body))),
+            ]
+
+        start_response(status, headers, exc_info)
+
+        return [body]
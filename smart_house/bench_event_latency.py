@@ -0,0 +1,118 @@
+"""Benchmark input latency of event loop while calling a slow IoT Hub.
+
+Runs on Linux with CPython from the ``smart_house`` folder, e.g.
+``python bench_event_latency.py 0 100 500``, arguments being hub delays in
+milliseconds. A stand-in hub answers keepalives after the delay, while the
+event loop keeps calling it and an input task, polling like
+``event_consumer``, measures how late it gets to run. Calls are made with
+blocking ``urllib`` like ``urequests`` did, and with ``core.hub_http``.
+"""
+import asyncio
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+# Let firmware modules import CPython counterparts of MicroPython ones
+sys.modules.setdefault("uasyncio", asyncio)
+
+from core.hub_http import HttpClient  # noqa: E402
+
+DURATION_S = 3
+INPUT_POLL_MS = 100
+
+
+class StandInHub(BaseHTTPRequestHandler):
+    """Answers every request like a keepalive, after a configured delay."""
+
+    protocol_version = "HTTP/1.1"
+    delay_s = 0
+
+    def do_PUT(self):  # noqa: N802
+        """Read request body and answer after delay."""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay_s)
+
+        body = b'{"message":"Keepalive received","unique_id":"1337C0FFFEEE"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Keep benchmark output clean."""
+
+
+async def call_blocking(url, client):
+    """Call hub with blocking client, as the firmware did with ``urequests``."""
+    data = b'{"unique_id":"1337C0FFFEEE","ip_address":"10.0.0.1"}'
+    with urlopen(Request(url, data=data, method="PUT")) as response:  # noqa: S310
+        response.read()
+
+
+async def call_async(url, client):
+    """Call hub with non-blocking client over persistent connection."""
+    await client.request("PUT", url, data='{"unique_id":"1337C0FFFEEE"}')
+
+
+async def hub_caller(call, url, stop):
+    """Keep calling hub like the hub exchange task."""
+    client = HttpClient()
+    while not stop.is_set():
+        await call(url, client)
+        await asyncio.sleep(0.01)
+    client.close()
+
+
+async def input_poller(lateness, stop):
+    """Record how much later than planned every poll gets to run."""
+    while not stop.is_set():
+        planned = time.perf_counter() + INPUT_POLL_MS / 1000
+        await asyncio.sleep(INPUT_POLL_MS / 1000)
+        lateness.append(time.perf_counter() - planned)
+
+
+async def measure(call, url):
+    """Get worst and median input lateness in ms while calling hub."""
+    stop = asyncio.Event()
+    lateness = []
+    tasks = [
+        asyncio.ensure_future(hub_caller(call, url, stop)),
+        asyncio.ensure_future(input_poller(lateness, stop)),
+    ]
+
+    await asyncio.sleep(DURATION_S)
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    lateness.sort()
+
+    return lateness[-1] * 1000, lateness[len(lateness) // 2] * 1000
+
+
+def main():
+    """Print input lateness for every hub delay and client."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = (
+        f"http://127.0.0.1:{server.server_port}"
+        "/smarthouse/v1/houses/1337C0FFFEEE/keepalive"
+    )
+
+    for delay_ms in map(int, sys.argv[1:] or ["0", "100", "500"]):
+        StandInHub.delay_s = delay_ms / 1000
+
+        for name, call in (("blocking", call_blocking), ("async", call_async)):
+            worst, median = asyncio.run(measure(call, url))
+            print(
+                f"hub delay={delay_ms:>5}ms client={name:<8} "
+                f"input lateness p50={median:7.1f}ms max={worst:7.1f}ms"
+            )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
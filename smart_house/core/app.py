@@ -2,7 +2,11 @@
 """Provides main application object."""
 from binascii import hexlify
 from collections import deque
+from random import getrandbits
+from time import ticks_add, ticks_diff, ticks_ms
 
+from core.cbor import dumps as cbor_dumps, loads as cbor_loads
+from core.hub_http import HttpClient
 from core.menu import TextMenu
 from core.wifi import NetworkWiFi
 
@@ -19,9 +23,9 @@ from machine import Pin, SoftI2C, Timer, reset, unique_id
 
 from micropython import schedule
 
-from uasyncio import get_event_loop, sleep_ms
+from uasyncio import gather, get_event_loop, sleep_ms
 
-from urequests import request as http_request
+from ujson import dumps as json_dumps, loads as json_loads
 
 
 class App(Device):
@@ -42,7 +46,22 @@ class App(Device):
         self.config["wifi_ssid"] = config.get("wifi_ssid", "DefaultSmartHouseSSID")
         self.config["wifi_pass"] = config.get("wifi_pass", "DefaultSecretPassword")
         self.config["api_endpoint"] = config.get("api_endpoint", "http:/192.168.0.1/")
+        # Shortest keepalive interval, kept right after activity
         self.config["update_interval_ms"] = config.get("update_interval_ms", 1000)
+        # Above zero, keepalives are long-polled from their own uasyncio task
+        self.config["keepalive_wait_s"] = config.get("keepalive_wait_s", 0)
+        # Either "cbor" for compact binary hub calls or "json"
+        self.config["hub_wire_format"] = config.get("hub_wire_format", "cbor")
+        # Seconds to wait for IoT Hub response, on top of long-poll wait
+        self.config["hub_timeout_s"] = config.get("hub_timeout_s", 10)
+        # Ceiling of backoff between retries while IoT Hub is unreachable
+        self.config["hub_backoff_max_ms"] = config.get("hub_backoff_max_ms", 60000)
+        # Local changes are pushed together once quiet for the window, or at
+        # the latest after the delay since the first one, alarm ones at once
+        self.config["state_push_window_ms"] = config.get("state_push_window_ms", 500)
+        self.config["state_push_max_delay_ms"] = config.get(
+            "state_push_max_delay_ms", 2000
+        )
 
         self._log("Setting up core components")
 
@@ -56,12 +75,22 @@ class App(Device):
 
         self._log("* IoT Hub Update Timer")
         self._iot_hub_update_flag = False
+        self._iot_hub_long_poll_active = False
+        # Sequence number of the last command from IoT Hub applied
+        self._iot_hub_command_seq = 0
+        # Persistent connections, long-polls on their own not to hold up calls
+        self._iot_hub_client = HttpClient(timeout_s=self.config["hub_timeout_s"])
+        self._iot_hub_poll_client = HttpClient(timeout_s=self.config["hub_timeout_s"])
+        # Outbox of calls waiting for IoT Hub, state pushes are pending device
+        # names in _state_changes_local, so it cannot outgrow the devices
+        self._iot_hub_alarm_pending = False
+        self._iot_hub_backoff_ms = 0
+        self._iot_hub_retry_at = 0
+        # Keepalive interval, widened while idle up to the one hinted by hub
+        self._iot_hub_interval_ms = self.config["update_interval_ms"]
+        self._iot_hub_interval_hint_ms = self.config["update_interval_ms"]
         self._iot_hub_timer = Timer(0)
-        self._iot_hub_timer.init(
-            period=self.config["update_interval_ms"],
-            mode=Timer.PERIODIC,
-            callback=self._iot_hub_timer_callback,
-        )
+        self._iot_hub_schedule_keepalive(active=True)
 
         self._log("Setting up peripheral devices")
 
@@ -125,8 +154,14 @@ class App(Device):
             "wall_msg": f"ID:{self.unique_id}",
         }
 
-        self._state_change_local = False
+        # Names of devices whose state changed since last push to IoT Hub
+        self._state_changes_local = set()
+        self._state_change_first_at = 0
+        self._state_change_last_at = 0
         self._state_change_remote = False
+        # Local changes noted and pushes delivered, the difference saved
+        self._state_change_count = 0
+        self._state_push_count = 0
 
         self.menu = TextMenu(event_queue=self.event_queue, debug=self._DEBUG)
         self.menu.add_item("ALARM: DISARM   ", action=self._alarm_disarm)
@@ -149,10 +184,14 @@ class App(Device):
         """Gracefully exit by disconnecting from network and resetting I/O devices."""
         self._log("Exiting")
 
+        self._iot_hub_long_poll_active = False
+
         if isinstance(self.wlan, NetworkWiFi):
             if self.wlan.connected:
-                self._iot_hub_finalize()
+                self.loop.run_until_complete(self._iot_hub_finalize())
 
+            self._iot_hub_client.close()
+            self._iot_hub_poll_client.close()
             self.wlan.disconnect()
 
         if isinstance(self._iot_hub_timer, Timer):
@@ -176,43 +215,116 @@ class App(Device):
         if isinstance(self.alarm, Alarm):
             self.alarm.finalize()
 
-    def _iot_hub_call(
+    async def _iot_hub_call(
         self,
         call_method,
         call_url,
         call_json=None,
+        content_type="application/json",
+        timeout_s=0,
+        client=None,
     ):
-        """Call IoT Hub API."""
+        """Call IoT Hub API without blocking the event loop.
+
+        ``timeout_s`` extends the usual response timeout, like for long-polls.
+        Calls share one persistent connection unless given another ``client``,
+        and calls made together go out on it back to back. Returns ``None``
+        if IoT Hub could not take the call, which starts or extends backoff.
+        """
         self._log(f"* {call_method}: {call_json} -> {call_url}")
+
+        if self.config["hub_wire_format"] == "cbor":
+            encode = cbor_dumps
+            headers = {
+                "Content-Type": content_type.replace("json", "cbor"),
+                "Accept": "application/cbor",
+            }
+        else:
+            encode = json_dumps
+            headers = {"Content-Type": content_type}
+
         try:
-            response = http_request(  # noqa: S113
+            response = await (client or self._iot_hub_client).request(
                 method=call_method,
                 url=call_url,
-                json=call_json,
-                headers={"Content-Type": "application/json"},
+                data=encode(call_json) if call_json is not None else None,
+                headers=headers,
+                timeout_s=timeout_s,
             )
         except Exception as e:  # noqa: B902
             self._log(f"ERROR: {e}")
             self._lcd_out("ERROR: HUB CALL")
+            self._iot_hub_back_off()
 
             return None
 
-        try:
-            _response = response.json()
-        except ValueError:
-            _response = response.text
+        # Decoding just for the log would only churn heap
+        if self._DEBUG:
+            try:
+                _response = self._iot_hub_decode(response)
+            except ValueError:
+                _response = response.content
 
-        if response.status_code >= 200 and response.status_code <= 299:
-            self._log(f"* RESPONSE: {_response}")
-        else:
-            self._log(f"* ERROR: {response.status_code}: {_response}")
+            if response.status_code >= 200 and response.status_code <= 299:
+                self._log(f"* RESPONSE: {_response}")
+            else:
+                self._log(f"* ERROR: {response.status_code}: {_response}")
+
+        # Hub answering with server error is as good as down for the caller
+        if response.status_code >= 500:
+            self._iot_hub_back_off()
+
+            return None
+
+        self._iot_hub_backoff_ms = 0
 
         return response
 
-    def _iot_hub_register(self):
-        """Check-in with IoT Hub and provide initial state."""
+    def _iot_hub_back_off(self):
+        """Hold off IoT Hub calls for growing, jittered time after failure."""
+        # Calls failing together in one round count as one failure
+        if self._iot_hub_offline():
+            return
+
+        backoff_ms = min(
+            self._iot_hub_backoff_ms * 2 or self.config["update_interval_ms"],
+            self.config["hub_backoff_max_ms"],
+        )
+        self._iot_hub_backoff_ms = backoff_ms
+
+        # Random half of backoff spreads the fleet's retries once hub is back,
+        # which needs no secure randomness
+        jitter_ms = getrandbits(16) * (backoff_ms // 2) >> 16  # noqa: S311
+        delay_ms = backoff_ms // 2 + jitter_ms
+        self._iot_hub_retry_at = ticks_add(ticks_ms(), delay_ms)
+        self._log(f"* Retrying IoT Hub in {delay_ms} ms")
+
+    def _iot_hub_offline(self):
+        """Tell whether IoT Hub calls are held off after failure."""
+        return (
+            self._iot_hub_backoff_ms > 0
+            and ticks_diff(self._iot_hub_retry_at, ticks_ms()) > 0
+        )
+
+    async def _iot_hub_wait_online(self):
+        """Wait until backoff after failed IoT Hub call passes."""
+        while self._iot_hub_offline():
+            await sleep_ms(100)
+
+    def _iot_hub_decode(self, response):
+        """Decode IoT Hub response body, either CBOR or JSON."""
+        content = response.content
+
+        # JSON text starts with ASCII, CBOR maps and arrays from 0x80 up
+        if content and content[0] >= 0x80:
+            return cbor_loads(content)
+
+        return json_loads(content)
+
+    async def _iot_hub_register(self):
+        """Check-in with IoT Hub and provide initial state, tell if it went through."""
         self._log("Check-in with IoT Hub")
-        self._iot_hub_call(
+        response = await self._iot_hub_call(
             call_method="POST",
             call_url=f"{self.config.get('api_endpoint')}/houses",
             call_json={
@@ -222,67 +334,181 @@ class App(Device):
             },
         )
 
-    def _iot_hub_keepalive(self):
+        return response is not None
+
+    async def _iot_hub_keepalive(self):
         """Send keepalive and get latest state from IoT Hub if available."""
         self._log("Send keepalive to IoT Hub")
-        response = self._iot_hub_call(
+        response = await self._iot_hub_call(
             call_method="PUT",
-            call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}/keepalive",  # noqa: E501
+            call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}/keepalive?ack={self._iot_hub_command_seq}",  # noqa: E501
             call_json={
                 "unique_id": self.unique_id,
                 "ip_address": self.wlan.ip_address,
             },
         )
 
-        if response.status_code == 202:
+        if response is None:
+            self._iot_hub_schedule_keepalive(active=False)
+            return
+
+        try:
+            json_response = self._iot_hub_decode(response)
+        except ValueError:
+            json_response = {}
+
+        self._iot_hub_process_keepalive(response.status_code, json_response)
+
+        # Alarm, commands or state from IoT Hub are remote activity
+        self._iot_hub_schedule_keepalive(active=response.status_code != 200)
+
+    def _iot_hub_schedule_keepalive(self, active):
+        """Arm timer for next keepalive, soon after activity, later while idle.
+
+        Idle interval doubles up to the one hinted by IoT Hub, so without
+        hints keepalives keep ``update_interval_ms``. Long-polls need none.
+        """
+        shortest_ms = self.config["update_interval_ms"]
+
+        if active:
+            interval_ms = shortest_ms
+        else:
+            interval_ms = min(
+                self._iot_hub_interval_ms * 2, self._iot_hub_interval_hint_ms
+            )
+        self._iot_hub_interval_ms = max(shortest_ms, interval_ms)
+
+        if not self.config["keepalive_wait_s"]:
+            self._iot_hub_timer.init(
+                period=self._iot_hub_interval_ms,
+                mode=Timer.ONE_SHOT,
+                callback=self._iot_hub_timer_callback,
+            )
+
+    def _iot_hub_process_keepalive(self, status_code, json_response):
+        """Act on keepalive response: trigger alarm, apply commands or state."""
+        if "interval_s" in json_response:
+            self._iot_hub_interval_hint_ms = int(json_response["interval_s"] * 1000)
+
+        if status_code == 202:
             self.alarm.set_trigger(triggered=True, period_ms=4000)
 
-        if response.status_code == 205:
-            self._iot_hub_get_state()
+        if status_code == 205:
+            if "commands" in json_response:
+                self._iot_hub_apply_commands(json_response["commands"])
+            elif "state" in json_response:
+                self._iot_hub_apply_state(json_response["state"])
+            else:
+                self._state_change_remote = True
+
+    async def _iot_hub_long_poll(self):
+        """Keep long-polling IoT Hub and pass responses to event queue.
+
+        Runs as its own task next to the hub exchange one, so a held
+        keepalive does not delay state pushes. Responses are handled by
+        ``event_processor``.
+        """
+        wait_s = self.config["keepalive_wait_s"]
+
+        while self._iot_hub_long_poll_active:
+            response = await self._iot_hub_call(
+                call_method="PUT",
+                call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}/keepalive?wait={wait_s}&ack={self._iot_hub_command_seq}",  # noqa: E501
+                call_json={
+                    "unique_id": self.unique_id,
+                    "ip_address": self.wlan.ip_address,
+                },
+                timeout_s=wait_s,
+                client=self._iot_hub_poll_client,
+            )
+
+            if response is None:
+                await self._iot_hub_wait_online()
+                continue
 
-    def _iot_hub_finalize(self):
+            try:
+                json_response = self._iot_hub_decode(response)
+            except ValueError:
+                json_response = {}
+
+            self.event_queue.append(
+                {
+                    "source": "/net/iot_hub",
+                    "state": {
+                        "status_code": response.status_code,
+                        "response": json_response,
+                    },
+                }
+            )
+
+            # Let event loop apply commands, so the next poll acknowledges them
+            commands = json_response.get("commands")
+            for _ in range(self.config["update_interval_ms"] // 50):
+                if not commands or self._iot_hub_command_seq >= commands[-1]["seq"]:
+                    break
+                await sleep_ms(50)
+
+    async def _iot_hub_finalize(self):
         """Gracefully check-out with IoT Hub."""
         self._log("Check-out with IoT Hub")
-        self._iot_hub_call(
+        await self._iot_hub_call(
             call_method="DELETE",
             call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}",
         )
 
-    def _iot_hub_set_state(self):
-        """Send latest state to IoT Hub."""
-        self._log("PUSH state to IoT Hub")
-        self._iot_hub_call(
-            call_method="PUT",
+    async def _iot_hub_set_state(self, devices):
+        """Send latest state of changed devices to IoT Hub as merge patch."""
+        self._log(f"PUSH state of {devices} to IoT Hub")
+        response = await self._iot_hub_call(
+            call_method="PATCH",
             call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}/state",
-            call_json={
-                "unique_id": self.unique_id,
-                "ip_address": self.wlan.ip_address,
-                "state": self._state,
-            },
+            call_json={device: self._state[device] for device in devices},
+            content_type="application/merge-patch+json",
+        )
+
+        # Keep devices pending, the retry pushes their state as of then
+        if response is None:
+            self._state_changes_local.update(devices)
+            return
+
+        self._state_push_count += 1
+        self._log(
+            f"* Pushed {self._state_push_count} times for "
+            f"{self._state_change_count} changes, "
+            f"{self._state_change_count - self._state_push_count} pushes saved"
         )
 
-    def _iot_hub_get_state(self):
+    async def _iot_hub_get_state(self):
         """Get latest state from IoT Hub."""
         self._log("PULL state from IoT Hub")
-        response = self._iot_hub_call(
+        response = await self._iot_hub_call(
             call_method="GET",
             call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}/state",
         )
 
+        if response is None:
+            self._state_change_remote = True
+            return
+
         try:
-            json_response = response.json()
+            json_response = self._iot_hub_decode(response)
         except ValueError:
-            self._log("ERROR: State response not in JSON")
-        finally:
-            wall_msg_ui = json_response["wall_msg"]
-            if self._state["wall_msg"] != wall_msg_ui:
-                self._log("* WALL MSG: CHANGED")
-                self._state["wall_msg"] = wall_msg_ui
-                self._lcd_out(self.menu.get_current_content(), show_wall_msg=True)
-            
-            buzzer_active_ui = json_response["buzzer"]["active"]
-            if self.buzzer._state["active"] != buzzer_active_ui:
-                if buzzer_active_ui:
+            self._log("ERROR: State response not decodable")
+        else:
+            self._iot_hub_apply_state(json_response)
+
+    def _iot_hub_apply_commands(self, commands):
+        """Apply commands from IoT Hub in order, skipping already applied ones."""
+        for command in commands:
+            if command["seq"] > self._iot_hub_command_seq:
+                self._iot_hub_apply_device(command["device"], command["active"])
+                self._iot_hub_command_seq = command["seq"]
+
+    def _iot_hub_apply_device(self, device, active):
+        """Turn local device on or off as set from IoT Hub."""
+        if device == "buzzer":
+            if self.buzzer._state["active"] != active:
+                if active:
                     self._log("* BUZZER: PLAY")
                     self.buzzer.start_melody()
                 else:
@@ -291,9 +517,9 @@ class App(Device):
             else:
                 self._log("* BUZZER: UNCHANGED")
 
-            fan_active_ui = json_response["fan"]["active"]
-            if self.fan._state["active"] != fan_active_ui:
-                if fan_active_ui:
+        if device == "fan":
+            if self.fan._state["active"] != active:
+                if active:
                     self._log("* FAN: ON")
                     self.fan.turn_on(clockwise=True)
                 else:
@@ -302,9 +528,9 @@ class App(Device):
             else:
                 self._log("* FAN: UNCHANGED")
 
-            led_active_ui = json_response["led"]["active"]
-            if self.led._state["active"] != led_active_ui:
-                if led_active_ui:
+        if device == "led":
+            if self.led._state["active"] != active:
+                if active:
                     self._log("* LED: ON")
                     self.led.turn_on()
                 else:
@@ -313,14 +539,28 @@ class App(Device):
             else:
                 self._log("* LED: UNCHANGED")
 
-    def _iot_hub_report_alarm(self):
+    def _iot_hub_apply_state(self, json_response):
+        """Apply state from IoT Hub to local devices."""
+        wall_msg_ui = json_response["wall_msg"]
+        if self._state["wall_msg"] != wall_msg_ui:
+            self._log("* WALL MSG: CHANGED")
+            self._state["wall_msg"] = wall_msg_ui
+            self._lcd_out(self.menu.get_current_content(), show_wall_msg=True)
+
+        for device in ("buzzer", "fan", "led"):
+            self._iot_hub_apply_device(device, json_response[device]["active"])
+
+    async def _iot_hub_report_alarm(self):
         """Send alarm report to trigger other global alarms through IoT Hub."""
         self._log("Send alarm report to IoT Hub")
-        self._iot_hub_call(
+        response = await self._iot_hub_call(
             call_method="PUT",
             call_url=f"{self.config.get('api_endpoint')}/houses/{self.unique_id}/report_alarm",  # noqa: E501
         )
 
+        if response is None:
+            self._iot_hub_alarm_pending = True
+
     def _iot_hub_timer_callback(self, t):
         """Raise update flag."""
         self._iot_hub_update_flag = True
@@ -340,56 +580,59 @@ class App(Device):
     def _alarm_disarm(self, _):
         self._log("Disarming ALARM")
         self.alarm.disarm()
-        self._state_change_local = True
+        self._note_state_change("alarm")
 
     def _alarm_arm_global(self, _):
         self._log("Arming ALARM in GLOBAL mode")
         self.alarm.arm(Alarm.ALARM_MODE_GLOBAL)
-        self._state_change_local = True
+        self._note_state_change("alarm")
 
     def _alarm_arm_local(self, _):
         self._log("Arming ALARM in LOCAL mode")
         self.alarm.arm(Alarm.ALARM_MODE_LOCAL)
-        self._state_change_local = True
+        self._note_state_change("alarm")
 
     def _buzzer_play(self, _):
         self._log("Starting BUZZER")
         self.buzzer.start_melody()
-        self._state_change_local = True
+        self._note_state_change("buzzer")
 
     def _buzzer_stop(self, _):
         self._log("Stopping BUZZER")
         self.buzzer.stop_melody()
-        self._state_change_local = True
+        self._note_state_change("buzzer")
 
     def _fan_turn_clockwise(self, _):
         self._log("Spinning fan CLOCKWISE")
         self.fan.turn_on(clockwise=True)
-        self._state_change_local = True
+        self._note_state_change("fan")
 
     def _fan_turn_counterclockwise(self, _):
         self._log("Spinning fan COUTNERCLOCKWISE")
         self.fan.turn_on(clockwise=False)
-        self._state_change_local = True
+        self._note_state_change("fan")
 
     def _fan_turn_off(self, _):
         self._log("Turning Fan OFF")
         self.fan.turn_off()
-        self._state_change_local = True
+        self._note_state_change("fan")
 
     def _led_turn_on(self, _):
         self._log("Turning LED ON")
         self.led.turn_on()
-        self._state_change_local = True
+        self._note_state_change("led")
 
     def _led_turn_off(self, _):
         self._log("Turning LED OFF")
         self.led.turn_off()
-        self._state_change_local = True
+        self._note_state_change("led")
 
     def _reset(self, _):
         self._log("Performing SOFT RESET")
-        self._iot_hub_finalize()
+        self.loop.create_task(self._reset_after_finalize())
+
+    async def _reset_after_finalize(self):
+        await self._iot_hub_finalize()
         reset()
 
     async def event_consumer(self):
@@ -399,24 +642,100 @@ class App(Device):
                 event = self.event_queue.popleft()
                 self.event_processor(event)
 
+            await sleep_ms(100)
+
+    async def iot_hub_exchange(self):
+        """Exchange updates with IoT Hub in order, apart from event processing.
+
+        Awaiting the hub here leaves the event loop free, so inputs and LCD
+        are served while a call is in flight, however slow the hub is. Calls
+        due in the same round are queued together on the persistent
+        connection and sent in the order below, alarm reports first. While
+        IoT Hub is unreachable, pending calls wait in the outbox and go out
+        once backoff passes.
+        """
+        while not await self._iot_hub_register():
+            await self._iot_hub_wait_online()
+
+        if self.config["keepalive_wait_s"]:
+            self._iot_hub_long_poll_active = True
+            self.loop.create_task(self._iot_hub_long_poll())
+
+        while True:
+            if self._iot_hub_offline():
+                await sleep_ms(100)
+                continue
+
+            calls = []
+
+            if self._iot_hub_alarm_pending:
+                self._iot_hub_alarm_pending = False
+                calls.append(self._iot_hub_report_alarm())
+
             if self._iot_hub_update_flag:
                 self._iot_hub_update_flag = False
-                self._iot_hub_keepalive()
+                calls.append(self._iot_hub_keepalive())
 
             if self._state_change_remote:
                 self._state_change_remote = False
-                self._iot_hub_get_state()
+                calls.append(self._iot_hub_get_state())
+
+            if self._state_push_due():
+                devices = self._state_changes_local
+                self._state_changes_local = set()
+                calls.append(self._iot_hub_set_state(devices))
 
-            if self._state_change_local:
-                self._state_change_local = False
-                self._iot_hub_set_state()
+            if calls:
+                await gather(*calls)
 
             await sleep_ms(100)
 
+    def _note_state_change(self, device):
+        """Mark local device state as changed, to be pushed to IoT Hub."""
+        now = ticks_ms()
+
+        if not self._state_changes_local:
+            self._state_change_first_at = now
+
+        self._state_changes_local.add(device)
+        self._state_change_last_at = now
+        self._state_change_count += 1
+
+    def _state_push_due(self):
+        """Tell whether pending local changes should be pushed now.
+
+        Changes coming in a burst, like from a chattering motion sensor or
+        scrolling through menu actions, go out together in one push. Alarm
+        changes, including motion while armed, do not wait.
+        """
+        if not self._state_changes_local:
+            return False
+
+        if "alarm" in self._state_changes_local or (
+            "motion" in self._state_changes_local and self.alarm._state["armed"]
+        ):
+            return True
+
+        now = ticks_ms()
+
+        return (
+            ticks_diff(now, self._state_change_last_at)
+            >= self.config["state_push_window_ms"]
+            or ticks_diff(now, self._state_change_first_at)
+            >= self.config["state_push_max_delay_ms"]
+        )
+
     def event_processor(self, event):
         """Process event."""
         self._log(f"Got event: {event}")
 
+        # Local activity brings keepalives back to the shortest interval
+        if (
+            event["source"] != "/net/iot_hub"
+            and self._iot_hub_interval_ms > self.config["update_interval_ms"]
+        ):
+            self._iot_hub_schedule_keepalive(active=True)
+
         if event["source"] == "/in/button_a" and event["state"]["pressed"]:
             self.menu.move_next()
             self._lcd_out(self.menu.get_current_content(), show_wall_msg=True)
@@ -434,7 +753,12 @@ class App(Device):
                 if event["state"]["motion_detected"]:
                     self.alarm.set_trigger(triggered=True, period_ms=2000)
 
-            self._state_change_local = True
+            self._note_state_change("motion")
+
+        if event["source"] == "/net/iot_hub":
+            self._iot_hub_process_keepalive(
+                event["state"]["status_code"], event["state"]["response"]
+            )
 
         if event["source"] == "/dev/alarm":
             if event["state"]["triggered"]:
@@ -442,10 +766,10 @@ class App(Device):
                     self.buzzer.start_melody()
 
                 if event["state"]["mode"] != Alarm.ALARM_MODE_LOCAL:
-                    self._iot_hub_report_alarm()
+                    self._iot_hub_alarm_pending = True
 
                     self.alarm.arm(mode=Alarm.ALARM_MODE_LOCAL)
-                    self._state_change_local = True
+                    self._note_state_change("alarm")
 
             else:
                 if event["state"]["mode"] != Alarm.ALARM_MODE_SENSOR:
@@ -464,11 +788,10 @@ class App(Device):
             self.exit_code = 1
 
         if self.exit_code == 0:
-            self._iot_hub_register()
-
             self._lcd_out(self.menu.get_current_content())
 
             self.loop.create_task(self.event_consumer())
+            self.loop.create_task(self.iot_hub_exchange())
 
             self._log("Enter event loop")
             try:
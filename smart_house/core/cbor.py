@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Provides compact CBOR (RFC 8949) codec for IoT Hub calls.
+
+Covers what house state and hub responses use: integers, floats, strings,
+byte strings, booleans, None, lists and dicts. Written for MicroPython, so
+it avoids anything beyond ``struct`` and builds frames in one bytearray.
+"""
+from struct import pack, unpack_from
+
+_MAJOR_UINT = 0x00
+_MAJOR_NEGINT = 0x20
+_MAJOR_BYTES = 0x40
+_MAJOR_TEXT = 0x60
+_MAJOR_ARRAY = 0x80
+_MAJOR_MAP = 0xA0
+
+_FALSE = 0xF4
+_TRUE = 0xF5
+_NULL = 0xF6
+_FLOAT64 = 0xFB
+
+
+def _encode_head(out, major, length):
+    """Append item head with major type and length or value."""
+    if length < 24:
+        out.append(major | length)
+    elif length < 0x100:
+        out.append(major | 24)
+        out.append(length)
+    elif length < 0x10000:
+        out.append(major | 25)
+        out.extend(pack(">H", length))
+    elif length < 0x100000000:
+        out.append(major | 26)
+        out.extend(pack(">I", length))
+    else:
+        out.append(major | 27)
+        out.extend(pack(">Q", length))
+
+
+def _encode(out, value):
+    """Append encoded value."""
+    # Check bool before int, True and False are ints too
+    if value is None:
+        out.append(_NULL)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        if value >= 0:
+            _encode_head(out, _MAJOR_UINT, value)
+        else:
+            _encode_head(out, _MAJOR_NEGINT, -1 - value)
+    elif isinstance(value, float):
+        out.append(_FLOAT64)
+        out.extend(pack(">d", value))
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        _encode_head(out, _MAJOR_TEXT, len(encoded))
+        out.extend(encoded)
+    elif isinstance(value, (bytes, bytearray)):
+        _encode_head(out, _MAJOR_BYTES, len(value))
+        out.extend(value)
+    elif isinstance(value, (list, tuple)):
+        _encode_head(out, _MAJOR_ARRAY, len(value))
+        for item in value:
+            _encode(out, item)
+    elif isinstance(value, dict):
+        _encode_head(out, _MAJOR_MAP, len(value))
+        for key, item in value.items():
+            _encode(out, key)
+            _encode(out, item)
+    else:
+        raise ValueError(f"Cannot encode {type(value)} to CBOR")
+
+
+def dumps(value):
+    """Encode value to CBOR bytes."""
+    out = bytearray()
+    _encode(out, value)
+
+    return bytes(out)
+
+
+def _decode_half(bits):
+    """Decode IEEE 754 half-precision float."""
+    exponent = (bits >> 10) & 0x1F
+    fraction = bits & 0x3FF
+
+    if exponent == 0:
+        value = fraction * 2.0**-24
+    elif exponent == 0x1F:
+        value = float("nan") if fraction else float("inf")
+    else:
+        value = (1024 + fraction) * 2.0 ** (exponent - 25)
+
+    return -value if bits & 0x8000 else value
+
+
+def _decode(data, offset):
+    """Decode item starting at offset, return value and offset after it."""
+    initial = data[offset]
+    major = initial & 0xE0
+    info = initial & 0x1F
+    offset += 1
+
+    if major == 0xE0:
+        if info == 20:
+            return False, offset
+        if info == 21:
+            return True, offset
+        if info in (22, 23):
+            return None, offset
+        if info == 25:
+            return _decode_half(unpack_from(">H", data, offset)[0]), offset + 2
+        if info == 26:
+            return unpack_from(">f", data, offset)[0], offset + 4
+        if info == 27:
+            return unpack_from(">d", data, offset)[0], offset + 8
+        raise ValueError(f"Unsupported CBOR simple value {info}")
+
+    if info < 24:
+        length = info
+    elif info == 24:
+        length = data[offset]
+        offset += 1
+    elif info == 25:
+        length = unpack_from(">H", data, offset)[0]
+        offset += 2
+    elif info == 26:
+        length = unpack_from(">I", data, offset)[0]
+        offset += 4
+    elif info == 27:
+        length = unpack_from(">Q", data, offset)[0]
+        offset += 8
+    else:
+        raise ValueError("Indefinite CBOR lengths are not supported")
+
+    if major == _MAJOR_UINT:
+        return length, offset
+    if major == _MAJOR_NEGINT:
+        return -1 - length, offset
+    if major == _MAJOR_BYTES:
+        end = offset + length
+        return bytes(data[offset:end]), end
+    if major == _MAJOR_TEXT:
+        end = offset + length
+        return str(data[offset:end], "utf-8"), end
+
+    if major == _MAJOR_ARRAY:
+        items = []
+        for _ in range(length):
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return items, offset
+
+    if major == _MAJOR_MAP:
+        items = {}
+        for _ in range(length):
+            key, offset = _decode(data, offset)
+            value, offset = _decode(data, offset)
+            items[key] = value
+        return items, offset
+
+    # Tags only annotate the item that follows
+    return _decode(data, offset)
+
+
+def loads(data):
+    """Decode CBOR bytes to value."""
+    try:
+        value, _ = _decode(data, 0)
+    except (IndexError, TypeError) as e:
+        raise ValueError(f"Malformed CBOR: {e}")
+
+    return value
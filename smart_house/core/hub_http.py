@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Provides non-blocking HTTP/1.1 client on uasyncio streams.
+
+One client holds one persistent connection per endpoint, so calls after the
+first one skip DNS lookup and TCP handshake. Requests made together queue up
+and go out back to back, each right after the previous response. They are
+not pipelined on the wire, as servers like gunicorn threaded workers stall
+on requests sent ahead. Only plain ``http://`` URLs are supported, as used
+for the IoT Hub.
+The same code runs on CPython ``asyncio`` made importable as ``uasyncio``.
+"""
+from uasyncio import Event, open_connection, wait_for
+
+
+class Response:
+    """Holds HTTP response like the one of ``urequests``."""
+
+    def __init__(self, status_code, headers, content):
+        """Initiate response with its status code, headers and body."""
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+
+def split_url(url):
+    """Split ``http://host[:port]/path`` into host, port and path."""
+    proto, _, rest = url.split("/", 2)
+    if proto != "http:":
+        raise ValueError(f"Unsupported URL: {url}")
+
+    netloc, _, path = rest.partition("/")
+    host, _, port = netloc.partition(":")
+
+    return host, int(port) if port else 80, "/" + path
+
+
+def _encode_request(method, host, path, data, headers):
+    """Build HTTP/1.1 request bytes."""
+    head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+    for name, value in headers.items():
+        head += f"{name}: {value}\r\n"
+    if data is not None or method in ("POST", "PUT", "PATCH"):
+        head += f"Content-Length: {len(data or b'')}\r\n"
+
+    return head.encode() + b"\r\n" + (data or b"")
+
+
+async def _read_chunked(reader):
+    """Read body sent with chunked transfer encoding."""
+    content = b""
+
+    while True:
+        size = int((await reader.readline()).split(b";", 1)[0], 16)
+        if size == 0:
+            # Skip trailers up to the closing empty line
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            return content
+
+        content += await reader.readexactly(size)
+        await reader.readexactly(2)
+
+
+async def _read_response(reader):
+    """Read one response, return it and whether connection stays usable."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise OSError("Connection closed by server")
+
+    version, status_code = status_line.split(None, 2)[:2]
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line or line == b"\r\n":
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep_open = headers.get("connection", "").lower() != "close" and (
+        version == b"HTTP/1.1" or headers.get("connection", "").lower() == "keep-alive"
+    )
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        content = await _read_chunked(reader)
+    elif "content-length" in headers:
+        content = await reader.readexactly(int(headers["content-length"]))
+    else:
+        # Body without length ends with the connection
+        content = await reader.read(-1)
+        keep_open = False
+
+    return Response(int(status_code), headers, content), keep_open
+
+
+class HttpClient:
+    """Sends HTTP requests over persistent connections, one per endpoint.
+
+    A connection found closed or broken when reused is opened again and the
+    request sent once more, which covers servers dropping idle connections.
+    Requests fail only if the fresh connection fails too.
+    """
+
+    def __init__(self, timeout_s=10):
+        """Initiate client without connections."""
+        self._timeout_s = timeout_s
+        self._connections = {}
+        self._queue = []
+        self._busy = False
+
+    async def request(self, method, url, data=None, headers=None, timeout_s=0):
+        """Send HTTP request without blocking the event loop and get response.
+
+        ``timeout_s`` extends the usual response timeout, like for long-polls.
+        Raises ``OSError`` if the server cannot be reached or the connection
+        breaks, and ``TimeoutError`` if the response does not come in time.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+
+        host, port, path = split_url(url)
+        entry = {
+            "endpoint": (host, port),
+            "request": _encode_request(method, host, path, data, headers or {}),
+            "timeout_s": self._timeout_s + timeout_s,
+            "done": Event(),
+        }
+        self._queue.append(entry)
+
+        # First caller sends its request and everything queued meanwhile
+        if not self._busy:
+            self._busy = True
+            try:
+                while self._queue:
+                    await self._send(self._queue.pop(0))
+            finally:
+                self._busy = False
+
+        await entry["done"].wait()
+
+        if "error" in entry:
+            raise entry["error"]
+
+        return entry["response"]
+
+    async def _send(self, entry):
+        """Exchange queued request and hand out its response or error."""
+        try:
+            entry["response"] = await wait_for(
+                self._exchange(entry["endpoint"], entry["request"]),
+                entry["timeout_s"],
+            )
+        except Exception as e:  # noqa: B902
+            # Connection is left in the middle of an exchange
+            self._drop(entry["endpoint"])
+            entry["error"] = e
+
+        entry["done"].set()
+
+    async def _exchange(self, endpoint, request):
+        """Write request and read its response, reconnecting if stale."""
+        reused = endpoint in self._connections
+
+        while True:
+            if endpoint not in self._connections:
+                self._connections[endpoint] = await open_connection(*endpoint)
+            reader, writer = self._connections[endpoint]
+
+            try:
+                writer.write(request)
+                await writer.drain()
+                response, keep_open = await _read_response(reader)
+            except (OSError, EOFError, ValueError):
+                self._drop(endpoint)
+                if reused:
+                    reused = False
+                    continue
+                raise
+
+            if not keep_open:
+                self._drop(endpoint)
+
+            return response
+
+    def _drop(self, endpoint):
+        """Close connection to endpoint, if any."""
+        connection = self._connections.pop(endpoint, None)
+        if connection is not None:
+            connection[1].close()
+
+    def close(self):
+        """Close all connections."""
+        for endpoint in list(self._connections):
+            self._drop(endpoint)
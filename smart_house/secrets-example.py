@@ -9,4 +9,10 @@ secret_config = {
     "wifi_pass": "SecretSquirrelSavesTheDay",
     "api_endpoint": "http://192.168.15.42/smarthouse/v1",
     "update_interval_ms": 1000,
+    "keepalive_wait_s": 0,
+    "hub_wire_format": "cbor",
+    "hub_timeout_s": 10,
+    "hub_backoff_max_ms": 60000,
+    "state_push_window_ms": 500,
+    "state_push_max_delay_ms": 2000,
 }